@@ -74,10 +74,33 @@ class PrecisionDac
         ctl.write<reg::precision_dac_data1>((dac_values[3] << 16) + (dac_values[2] & 0xFFFF));
     }
 
+    // Update the codes of all the channels at once
+    void set_dac_values(const std::array<uint32_t, n_dacs>& codes) {
+        for (uint32_t i = 0; i < n_dacs; i++) {
+            // 16 bits codes: a larger code would carry into the other channel of the register
+            dac_values[i] = codes[i];
+
+            if (dac_values[i] > 0xFFFF) {
+                dac_values[i] = 0xFFFF;
+            }
+
+            if (std::abs(cal_coeffs[2 * i]) > 0.0f) {
+                values_volt[i] = (float(dac_values[i]) - cal_coeffs[2 * i + 1]) / cal_coeffs[2 * i];
+            }
+        }
+
+        ctl.write<reg::precision_dac_data0>((dac_values[1] << 16) + (dac_values[0] & 0xFFFF));
+        ctl.write<reg::precision_dac_data1>((dac_values[3] << 16) + (dac_values[2] & 0xFFFF));
+    }
+
     auto get_dac_values() const {
         return values_volt;
     }
 
+    auto get_calibration_coeffs() const {
+        return cal_coeffs;
+    }
+
     int32_t set_calibration_coeffs(const std::array<float, 2 * n_dacs>& new_coeffs) {
         cal_coeffs = new_coeffs;
         static_assert(2 * n_dacs * sizeof(float) <= eeprom_map::precision_dac_calib::range, "");
@@ -48,6 +48,7 @@ class Decimator
         do {} while (get_fifo_length() < n_pts);
     }
 
+    /// @stream
     auto& read_adc() {
         wait_for(ARR_SIZE);
         for (unsigned int i=0; i < ARR_SIZE; i++) {
@@ -86,6 +86,7 @@ class Pulse
         do {} while (get_fifo_length() < n_pts);
     }
 
+    /// @stream
     std::vector<uint32_t>& get_next_pulse(uint32_t n_pts) {
 
         fifo_acquisition_started = false;
@@ -61,3 +61,11 @@ class Pulse(object):
         assert(data_rcv[0] & (1 << 15) == (1 << 15))
         return data_rcv
 
+
+    def stream_next_pulse(self, n_pts, count=None):
+        ''' Iterate over the pulses pushed by the server '''
+        assert n_pts > 0
+        assert n_pts <= 16386
+        for data_rcv in self.client.stream('Pulse', 'get_next_pulse', (n_pts,), count=count):
+            assert(data_rcv[0] & (1 << 15) == (1 << 15))
+            yield data_rcv
@@ -4,8 +4,8 @@ TMP_FPGA_PATH := $(TMP_PROJECT_PATH)/fpga
 $(TMP_FPGA_PATH):
 	@mkdir -p $@
 
-BOARD_PATH := $(shell $(MAKE_PY) --board $(CONFIG) $(TMP_FPGA_PATH)/board && cat $(TMP_FPGA_PATH)/board)
-PART := $(shell cat $(BOARD_PATH)/PART)
+BOARD_PATH := $(shell cat $(TMP_FPGA_PATH)/board 2> /dev/null)
+PART := $(shell cat $(BOARD_PATH)/PART 2> /dev/null)
 
 VIVADO := source $(VIVADO_PATH)/$(VIVADO_VERSION)/settings64.sh && vivado -nolog -nojournal
 VIVADO_BATCH := $(VIVADO) -mode batch
@@ -13,6 +13,8 @@ VIVADO_BATCH := $(VIVADO) -mode batch
 $(MEMORY_YML): $(CONFIG)
 	$(MAKE_PY) --memory_yml $(CONFIG) $@
 
+-include $(MEMORY_YML).d
+
 # Cores
 ###############################################################################
 TMP_CORES_PATH := $(TMP_PROJECT_PATH)/cores
@@ -20,7 +22,7 @@ TMP_CORES_PATH := $(TMP_PROJECT_PATH)/cores
 $(TMP_CORES_PATH):
 	@mkdir -p $@
 
-CORES := $(shell $(MAKE_PY) --cores $(CONFIG) $(TMP_CORES_PATH)/core_list && cat $(TMP_CORES_PATH)/core_list)
+CORES := $(shell cat $(TMP_CORES_PATH)/core_list 2> /dev/null)
 CORES_COMPONENT_XML := $(addsuffix /component.xml, $(addprefix $(TMP_CORES_PATH)/, $(notdir $(CORES))))
 
 define make_core_target
@@ -33,7 +35,7 @@ $(foreach core,$(CORES),$(eval $(call make_core_target,$(core))))
 # Vivado project
 ###############################################################################
 
-XDC := $(shell $(MAKE_PY) --xdc $(CONFIG) $(TMP_FPGA_PATH)/xdc && cat $(TMP_FPGA_PATH)/xdc)
+XDC := $(shell cat $(TMP_FPGA_PATH)/xdc 2> /dev/null)
 
 CONFIG_TCL := $(TMP_FPGA_PATH)/config.tcl
 
@@ -41,6 +43,8 @@ $(CONFIG_TCL): $(MEMORY_YML) $(FPGA_PATH)/config.tcl
 	$(MAKE_PY) --config_tcl $(CONFIG) $@
 	@echo [$@] OK
 
+-include $(CONFIG_TCL).d
+
 .PHONY: xpr
 xpr: $(TMP_FPGA_PATH)/$(NAME).xpr
 
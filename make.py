@@ -3,7 +3,12 @@
 
 import os
 import sys
+import copy
 import json
+import pickle
+import hashlib
+import shlex
+import traceback
 import jinja2
 import yaml
 import server
@@ -18,13 +23,59 @@ def append_path(filename, file_path):
 
     return filename
 
+# LibYAML bindings are much faster than the pure Python loader
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YamlDumper = getattr(yaml, 'CDumper', yaml.Dumper)
+
+# Parsed configs: {abspath: (mtime, size, sha256, config)}
+# Saved in the file CONFIG_CACHE (if defined) to be shared by all the make.py commands.
+config_cache = {}
+config_cache_updated = False
+
+def load_config_cache(cache_filename):
+    global config_cache
+    try:
+        with open(cache_filename, 'rb') as f:
+            config_cache = pickle.load(f)
+    except Exception:
+        # Missing or unreadable cache: start from scratch
+        config_cache = {}
+
+def save_config_cache(cache_filename):
+    if config_cache_updated:
+        dirname = os.path.dirname(cache_filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp_filename = '{}.{}'.format(cache_filename, os.getpid())
+        with open(tmp_filename, 'wb') as f:
+            pickle.dump(config_cache, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_filename, cache_filename)
+
 def load_config(config_filename):
-    ''' Get the config dictionary from the file 'config.yml' '''
+    ''' Get the config dictionary from the file 'config.yml'
 
-    with open(config_filename) as f:
-        config = yaml.safe_load(f)
+    The file is parsed only if it is not in the cache: a cached config is
+    used if the file has the same mtime and size, or else the same content hash.
+    Returns a copy that the caller can modify.
+    '''
+    global config_cache_updated
+    key = os.path.abspath(config_filename)
+    stat = os.stat(config_filename)
+    entry = config_cache.get(key)
+
+    if entry is None or entry[:2] != (stat.st_mtime, stat.st_size):
+        with open(config_filename, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if entry is None or entry[2] != digest:
+            entry = (stat.st_mtime, stat.st_size, digest, yaml.load(content, Loader=YamlLoader))
+        else:
+            # Touched but unchanged
+            entry = (stat.st_mtime, stat.st_size) + entry[2:]
+        config_cache[key] = entry
+        config_cache_updated = True
 
-    return config
+    return copy.deepcopy(entry[3])
 
 def parse_brackets(string):
     ''' ex: 'pwm', '4' = parse_brackets('pwm[4]') '''
@@ -75,6 +126,92 @@ def build_registers(registers, parameters):
     registers = new_registers
     return registers
 
+#########################
+# Memory map
+#########################
+
+# Lowest address assigned to a memory without offset (start of the Zynq M_AXI_GP0 space)
+MEMORY_BASE = 0x40000000
+MEMORY_END = 0x100000000
+
+# Minimum range of an AXI slave
+MIN_RANGE = 4096
+
+REGISTER_MEMORIES = [('control_registers', 'control'), ('ps_control_registers', 'ps_control'),
+                     ('status_registers', 'status'), ('ps_status_registers', 'ps_status')]
+
+def parse_size(string):
+    ''' ex: 65536 = parse_size('64K') '''
+    string = str(string).strip()
+    for suffix, factor in [('K', 1 << 10), ('M', 1 << 20), ('G', 1 << 30)]:
+        if string.endswith(suffix):
+            return int(string[:-1], 0) * factor
+    return int(string, 0)
+
+def build_memory_map(memory):
+    ''' Assign the offsets of the memories without offset and check the memory map.
+
+    A memory occupies n_blocks contiguous blocks of size range.
+    The range must be a power of two (at least 4K) and the offset aligned on the range.
+    A memory without offset is placed at the lowest free aligned address above MEMORY_BASE.
+    The assigned offsets are written back in the memory list (as for the config offsets).
+    Returns the list of (name, offset, range, n_blocks) sorted by offset.
+    Raises ValueError if the memory map is invalid.
+    '''
+    memory_map = []
+
+    def find_overlap(offset, size):
+        for other in memory_map:
+            if offset < other[1] + other[2] * other[3] and other[1] < offset + size:
+                return other
+
+    # Memories with a fixed offset first, in declaration order
+    for address in sorted(memory, key=lambda address: 'offset' not in address):
+        range_ = parse_size(address['range'])
+        if range_ < MIN_RANGE or range_ & (range_ - 1):
+            raise ValueError('Memory {}: range {} is not a power of two >= 4K'.format(address['name'], address['range']))
+        size = range_ * address['n_blocks']
+
+        if 'offset' in address:
+            offset = parse_size(address['offset'])
+        else:
+            offset = MEMORY_BASE
+            while find_overlap(offset, size) is not None:
+                other = find_overlap(offset, size)
+                offset = other[1] + other[2] * other[3]
+                offset += -offset % range_
+            address['offset'] = '0x{:08X}'.format(offset)
+
+        if offset % range_ != 0:
+            raise ValueError('Memory {}: offset {} is not aligned on its range {}'.format(address['name'], address['offset'], address['range']))
+        if offset + size > MEMORY_END:
+            raise ValueError('Memory {}: exceeds the 32-bit address space'.format(address['name']))
+        other = find_overlap(offset, size)
+        if other is not None:
+            raise ValueError('Memory {} overlaps memory {}'.format(address['name'], other[0]))
+
+        memory_map.append((address['name'], offset, range_, address['n_blocks']))
+
+    return sorted(memory_map, key=lambda entry: entry[1])
+
+def build_register_map(config, memory_map):
+    ''' Register offsets (in bytes) in their memory: {memory_name: [(register, offset)]}
+
+    Raises ValueError if the registers do not fit in their memory.
+    Registers without memory are skipped.
+    '''
+    ranges = {name: range_ for name, _, range_, _ in memory_map}
+    register_map = {}
+    for field, memory_name in REGISTER_MEMORIES:
+        registers = config.get(field, [])
+        # The memory can be missing in the config of an FPGA module
+        if not registers or memory_name not in ranges:
+            continue
+        if 4 * len(registers) > ranges[memory_name]:
+            raise ValueError('{}: {} registers do not fit in memory {}'.format(field, len(registers), memory_name))
+        register_map[memory_name] = [(register, 4 * i) for i, register in enumerate(registers)]
+    return register_map
+
 def append_memory_to_config(config):
     parameters = config.get('parameters', {})
     config['memory'] = build_memory(config.get('memory', {}), parameters)
@@ -82,23 +219,60 @@ def append_memory_to_config(config):
     config['ps_control_registers'] = build_registers(config.get('ps_control_registers', {}), parameters)
     config['status_registers'] = build_registers(config.get('status_registers', {}), parameters)
     config['ps_status_registers'] = build_registers(config.get('ps_status_registers', {}), parameters)
+    memory_map = build_memory_map(config['memory'])
+    build_register_map(config, memory_map)
     return config
 
+#########################
+# Modules
+#########################
+
+# Resolved modules by config filename (shared by the commands of a batch)
+modules_cache = {}
+
+# The cores are collected from the modules, the drivers and xdc files
+# are only those of the config itself
+MODULE_FIELDS = ['cores']
+CONFIG_FIELDS = ['drivers', 'xdc']
+
+def resolve_modules(config_filename, config=None, stack=()):
+    ''' Collect the cores of a config and of its modules (recursively).
+
+    Paths are relative to the config that declares them.
+    A config lists its own cores first, then the cores of its modules in
+    declaration order. Duplicates are removed, keeping the first occurrence.
+    The drivers and xdc files are those of the config only (not of its modules).
+    Returns a dict with one list per field, and the list of the config
+    files read ('configs'). The result is cached: do not modify it.
+    '''
+    key = os.path.normpath(config_filename)
+    if key in stack:
+        raise ValueError('Circular module dependency: ' + ' -> '.join(stack + (key,)))
+    if key in modules_cache:
+        return modules_cache[key]
+
+    if config is None:
+        config = load_config(config_filename)
+    config_path = os.path.dirname(config_filename)
+
+    resolved = {field: [append_path(path, config_path) for path in config.get(field) or []] for field in MODULE_FIELDS + CONFIG_FIELDS}
+    resolved['configs'] = [config_filename]
+
+    for module in config.get('modules') or []:
+        module_resolved = resolve_modules(append_path(module, config_path), stack=stack + (key,))
+        for field in MODULE_FIELDS + ['configs']:
+            resolved[field] += module_resolved[field]
+
+    resolved = {field: unique(paths) for field, paths in resolved.items()}
+    modules_cache[key] = resolved
+    return resolved
+
 def build_json(dict):
     dict_json = json.dumps(dict, separators=(',', ':')).replace('"', '\\"')
     return dict_json
 
 def dump_if_changed(filename, new_dict):
-    changed = False
-    if os.path.isfile(filename):
-        with open(filename, 'r') as yml_file:
-            old_dict = yaml.safe_load(yml_file)
-            if old_dict != new_dict:
-               changed = True
-
-    if not os.path.isfile(filename) or changed:
-        with open(filename, 'w') as yml_file:
-            yaml.dump(new_dict, yml_file)
+    server.write_if_changed(filename, yaml.dump(new_dict, Dumper=YamlDumper))
 
 #########################
 # Jinja2 template engine
@@ -128,37 +302,53 @@ def get_renderer():
     renderer.filters['replace_KMG'] = replace_KMG
     return renderer
 
+def write_dependencies(output_filename, dependencies):
+    ''' Write the make rule 'output: dependencies' in output.d
+
+    Every dependency also gets a rule without prerequisites,
+    so that make does not fail when a dependency is removed (as gcc -MP).
+    '''
+    dependencies = unique(dependencies)
+    rules = ['{}: {}'.format(output_filename, ' \\\n  '.join(dependencies)), '']
+    rules += ['{}:'.format(dependency) for dependency in dependencies]
+    server.write_if_changed(output_filename + '.d', '\n'.join(rules) + '\n', report=False)
+
+def unique(list_):
+    ''' Remove the duplicates of a list but keep its order '''
+    seen = set()
+    return [x for x in list_ if not (x in seen or seen.add(x))]
+
 def fill_template(config, template_filename, output_filename):
     template = get_renderer().get_template(template_filename)
-    with open(output_filename, 'w') as output:
-        output.write(template.render(config=config))
+    server.write_if_changed(output_filename, template.render(config=config))
 
 ###################
 # Main
 ###################
 
 SDK_PATH = os.getenv('SDK_PATH', '')
+CONFIG_CACHE = os.getenv('CONFIG_CACHE', '')
 
-if __name__ == "__main__":
+def run(args):
+    ''' Run a command: args = [cmd, config_filename, output_filename, ...]
 
-    cmd = sys.argv[1]
-    config_filename = sys.argv[2]
-    output_filename = sys.argv[3]
+    The files read to produce the output are written in a make
+    dependency file (output.d) and returned.
+    '''
+    cmd = args[0]
+    config_filename = args[1]
+    output_filename = args[2]
 
     output_dirname = os.path.dirname(output_filename)
-    if not os.path.exists(output_dirname):
+    if output_dirname and not os.path.exists(output_dirname):
         os.makedirs(output_dirname)
 
     config = load_config(config_filename)
     config_path = os.path.dirname(config_filename)
-
-    if sys.version_info[0] < 3:
-        reload(sys)
-        sys.setdefaultencoding('utf-8')
+    dependencies = [config_filename]
 
     if cmd == '--name':
-        with open(output_filename, 'w') as f:
-            f.write(config['name'])
+        server.write_if_changed(output_filename, config['name'])
 
     elif cmd == '--memory_yml':
         for field in ['drivers', 'web', 'cores', 'modules', 'name', 'board', 'version']:
@@ -167,66 +357,125 @@ if __name__ == "__main__":
 
     elif cmd == '--config_tcl':
         fill_template(append_memory_to_config(config), 'config.tcl', output_filename)
+        dependencies.append(os.path.join(SDK_PATH, 'fpga', 'config.tcl'))
 
     elif cmd == '--cores':
-        for module in config.get('modules', []):
-            module_path = os.path.dirname(module)
-            module = append_path(module, module_path)
-            module_config = load_config(module)
-            module_cores = module_config.get('cores')
-            if module_cores is not None:
-                config['cores'].extend(module_cores)
-            config['cores'] = list(set(config['cores']))
-
-        for i in range(len(config['cores'])):
-            config['cores'][i] = append_path(config['cores'][i], config_path)
-
-        with open(output_filename, 'w') as f:
-            f.write(' '.join(config.get('cores', [])))
+        modules = resolve_modules(config_filename, config)
+        server.write_if_changed(output_filename, ' '.join(modules['cores']))
+        dependencies += modules['configs'] + modules['cores']
 
     elif cmd == '--board':
         config['board'] = append_path(config['board'], config_path)
-        with open(output_filename, 'w') as f:
-            f.write(config['board'])
+        server.write_if_changed(output_filename, config['board'])
 
     elif cmd == '--drivers':
-        for i, path in enumerate(config.get('drivers', [])):
-            config['drivers'][i] = append_path(path, config_path)
-        with open(output_filename, 'w') as f:
-            f.write(' '.join(config.get('drivers', [])))
+        modules = resolve_modules(config_filename, config)
+        server.write_if_changed(output_filename, ' '.join(modules['drivers']))
+        dependencies += modules['configs']
 
     elif cmd == '--xdc':
-        for i, path in enumerate(config.get('xdc', [])):
-            config['xdc'][i] = append_path(path, config_path)
-        with open(output_filename, 'w') as f:
-            f.write(' '.join(config.get('xdc', [])))
+        modules = resolve_modules(config_filename, config)
+        server.write_if_changed(output_filename, ' '.join(modules['xdc']))
+        dependencies += modules['configs']
 
     elif cmd == '--memory_hpp':
         config = append_memory_to_config(config)
         config['json'] = build_json(config)
         fill_template(config, 'memory.hpp', output_filename)
+        dependencies.append(os.path.join(SDK_PATH, 'server', 'templates', 'memory.hpp'))
+
+    elif cmd == '--memory_py':
+        config = append_memory_to_config(config)
+        config['memory_map'] = build_memory_map(config['memory'])
+        config['register_map'] = build_register_map(config, config['memory_map'])
+        fill_template(config, 'memory.py.j2', output_filename)
+        dependencies.append(os.path.join(SDK_PATH, 'server', 'templates', 'memory.py.j2'))
 
     elif cmd == '--render_template':
-        template_filename = sys.argv[4]
-        for i in range(len(config['drivers'])):
-            config['drivers'][i] = append_path(config['drivers'][i], config_path)
-        server.render_template(template_filename, output_filename, server.get_drivers(config['drivers']))
+        template_filename = args[3]
+        modules = resolve_modules(config_filename, config)
+        server.render_template(template_filename, output_filename, server.get_drivers(modules['drivers']))
+        dependencies += modules['configs'] + [template_filename] + modules['drivers']
 
     elif cmd == '--render_interface':
-        driver_filename_hpp = sys.argv[4]
-        id_ = server.get_driver_id(config['drivers'], driver_filename_hpp)
+        driver_filename_hpp = args[3]
+        modules = resolve_modules(config_filename, config)
+        id_ = server.get_driver_id(modules['drivers'], driver_filename_hpp)
         server.render_driver(server.get_driver(driver_filename_hpp, id_), output_filename)
+        dependencies += modules['configs'] + [driver_filename_hpp] + [os.path.join(SDK_PATH, 'server', 'templates', 'interface_driver' + extension)
+                                                 for extension in ['.hpp', '.cpp']]
 
     elif cmd == '--web':
         for i, path in enumerate(config.get('web', [])):
             config['web'][i] = append_path(path, config_path)
-        with open(output_filename, 'w') as f:
-            f.write(' '.join(config.get('web', [])))
+        server.write_if_changed(output_filename, ' '.join(config.get('web', [])))
 
     elif cmd == '--version':
         config['version'] = config.get('version', '0.0.0')
-        with open(output_filename, 'w') as f:
-            f.write(config['version'])
+        server.write_if_changed(output_filename, config['version'])
+
+    else:
+        raise ValueError('Unknown command ' + cmd)
+
+    write_dependencies(output_filename, dependencies)
+    return dependencies
 
+def run_batch(manifest_filename):
+    ''' Run the commands listed in a manifest in a single process.
+
+    The manifest has one command per line, with the same arguments as on
+    the command line (ex: --render_template config.yml drivers_json.hpp server/templates/drivers_json.hpp).
+    Empty lines and lines starting with '#' are ignored.
+    Reads the manifest from stdin if manifest_filename is '-'.
+    A failing command does not prevent the next ones from running.
+    The files read by all the commands are written in manifest.d.
+    Returns the number of failed commands.
+    '''
+    if manifest_filename == '-':
+        lines = sys.stdin.readlines()
     else:
-        raise ValueError('Unknown command')
\ No newline at end of file
+        with open(manifest_filename) as f:
+            lines = f.readlines()
+
+    dependencies = []
+    n_errors = 0
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            try:
+                dependencies += run(shlex.split(line))
+            except Exception:
+                sys.stderr.write('Command failed: {}\n'.format(line))
+                traceback.print_exc()
+                n_errors += 1
+
+    if manifest_filename != '-':
+        write_dependencies(manifest_filename, dependencies)
+
+    return n_errors
+
+if __name__ == "__main__":
+
+    if sys.version_info[0] < 3:
+        reload(sys)
+        sys.setdefaultencoding('utf-8')
+
+    if CONFIG_CACHE:
+        load_config_cache(CONFIG_CACHE)
+
+    try:
+        if sys.argv[1] == '--batch':
+            n_errors = run_batch(sys.argv[2])
+        else:
+            run(sys.argv[1:])
+            n_errors = 0
+    finally:
+        if CONFIG_CACHE:
+            save_config_cache(CONFIG_CACHE)
+
+    # Report the outputs whose content changed
+    for filename in server.updated_files:
+        print('[{}] updated'.format(filename))
+
+    if n_errors > 0:
+        sys.exit(1)
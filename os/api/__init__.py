@@ -1,6 +1,20 @@
 import os
 import json
+import time
+import zlib
+import calendar
+import shutil
+import hashlib
+import itertools
+import threading
 import subprocess
+import zipfile
+from collections import OrderedDict
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 from flask import Flask, jsonify, request, make_response
 from werkzeug.utils import secure_filename
 import uwsgi
@@ -14,6 +28,22 @@ def get_name_from_zipfilename(zip_filename):
     split = os.path.splitext(base)
     return split[0] if split[1] == '.zip' else None
 
+# Index of the instrument archives: {zip_filename: (size, mtime, {name: content})}
+# The content of a file is read on first access (None until then).
+# An archive is indexed again when its size or mtime changes.
+zip_index_cache = {}
+
+def get_zip_index(zip_filename):
+    stat = os.stat(zip_filename)
+    entry = zip_index_cache.get(zip_filename)
+
+    if entry is None or entry[:2] != (stat.st_size, stat.st_mtime):
+        with zipfile.ZipFile(zip_filename) as archive:
+            entry = (stat.st_size, stat.st_mtime, dict.fromkeys(archive.namelist()))
+        zip_index_cache[zip_filename] = entry
+
+    return entry[2]
+
 def is_file_in_zip(zip_filename, target_filename):
 
     """
@@ -21,12 +51,9 @@ def is_file_in_zip(zip_filename, target_filename):
     target_filename = "version" # file in zip_filename
     """
 
-    zip_files_stdout = subprocess.Popen(["/usr/bin/unzip", "-l", zip_filename], stdout=subprocess.PIPE)
-    zip_files = zip_files_stdout.stdout.read()
-
-    if target_filename.encode() in zip_files:
-        return True
-    else:
+    try:
+        return target_filename in get_zip_index(zip_filename)
+    except (OSError, zipfile.BadZipfile):
         return False
 
 def read_file_in_zip(zip_filename, target_filename):
@@ -34,35 +61,192 @@ def read_file_in_zip(zip_filename, target_filename):
     """
     zip_filename = "/usr/local/instruments/led-blinker.zip"
     target_filename = "version" # file to read in zip_filename
+    Returns the first line of the file (bytes)
     """
 
-    target_stdout = subprocess.Popen(["/usr/bin/unzip", "-c", zip_filename, target_filename], stdout=subprocess.PIPE)
-    target_file_content = target_stdout.stdout.read().splitlines()[2]
+    index = get_zip_index(zip_filename)
+
+    if index[target_filename] is None:
+        with zipfile.ZipFile(zip_filename) as archive:
+            index[target_filename] = archive.read(target_filename)
 
-    return target_file_content
+    return index[target_filename].splitlines()[0]
+
+def get_file_sha256(filename):
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class Metrics(object):
+
+    """
+    Counters and timing histograms of the operations of the app
+    (install, extract, upload, delete...), by operation and status,
+    and total number of bytes uploaded
+    """
+
+    # Upper bounds (seconds) of the histogram buckets
+    buckets = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}   # {(name, status): count}
+        self.histograms = {} # {name: [bucket counts..., +Inf count, sum]}
+        self.upload_bytes = 0
+
+    def count(self, name, status='success'):
+        with self.lock:
+            self.counters[(name, status)] = self.counters.get((name, status), 0) + 1
+
+    def add_upload_bytes(self, n_bytes):
+        with self.lock:
+            self.upload_bytes += n_bytes
+
+    def observe(self, name, duration, status='success'):
+        with self.lock:
+            self.counters[(name, status)] = self.counters.get((name, status), 0) + 1
+            histogram = self.histograms.setdefault(name, [0] * (len(Metrics.buckets) + 2))
+            for i, bound in enumerate(Metrics.buckets + [float('inf')]):
+                if duration <= bound:
+                    histogram[i] += 1
+            histogram[-1] += duration
+
+    def timer(self, name):
+        return MetricsTimer(self, name)
+
+    def to_dict(self):
+        with self.lock:
+            counters = {}
+            for (name, status), value in self.counters.items():
+                counters.setdefault(name, {})[status] = value
+            histograms = {}
+            for name, histogram in self.histograms.items():
+                histograms[name] = {"buckets": dict(zip([str(bound) for bound in Metrics.buckets] + ["+Inf"], histogram[:-1])),
+                                    "count": histogram[-2], "sum": histogram[-1]}
+            upload_bytes = self.upload_bytes
+        return {"counters": counters, "durations": histograms, "upload_bytes": upload_bytes}
+
+    def to_prometheus(self, gauges):
+        lines = ['# TYPE koheron_api_operations_total counter']
+        with self.lock:
+            for (name, status), value in sorted(self.counters.items()):
+                lines.append('koheron_api_operations_total{{operation="{}",status="{}"}} {}'.format(name, status, value))
+            lines.append('# TYPE koheron_api_operation_duration_seconds histogram')
+            for name, histogram in sorted(self.histograms.items()):
+                for bound, value in zip([str(bound) for bound in Metrics.buckets] + ["+Inf"], histogram[:-1]):
+                    lines.append('koheron_api_operation_duration_seconds_bucket{{operation="{}",le="{}"}} {}'.format(name, bound, value))
+                lines.append('koheron_api_operation_duration_seconds_sum{{operation="{}"}} {}'.format(name, histogram[-1]))
+                lines.append('koheron_api_operation_duration_seconds_count{{operation="{}"}} {}'.format(name, histogram[-2]))
+            lines.append('# TYPE koheron_api_upload_bytes_total counter')
+            lines.append('koheron_api_upload_bytes_total {}'.format(self.upload_bytes))
+        for name, value in sorted(gauges.items()):
+            lines.append('# TYPE koheron_api_{} gauge'.format(name))
+            lines.append('koheron_api_{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+class MetricsTimer(object):
+
+    """
+    Context manager that observes the duration of an operation.
+    The status is 'failure' if an exception is raised or if the status attribute is set to it.
+    """
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.status = 'success'
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        status = 'failure' if exc_type is not None else self.status
+        self.metrics.observe(self.name, time.time() - self.start, status)
+        return False
+
+class UploadOffsetError(Exception):
+
+    """
+    Chunk not written at the end of the part file (offset is the expected one)
+    """
+
+    def __init__(self, offset):
+        super(UploadOffsetError, self).__init__('Invalid offset, expected {}'.format(offset))
+        self.offset = offset
+
+def get_dir_size(dirname):
+    return sum(os.path.getsize(os.path.join(root, filename))
+               for root, dirs, filenames in os.walk(dirname) for filename in filenames)
+
+def is_tmpfs(path):
+
+    """
+    True if path is on a tmpfs file system (mount point from /proc/mounts)
+    """
+
+    path = os.path.realpath(path)
+    mount_point = ''
+    fs_type = None
+
+    try:
+        with open('/proc/mounts', 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                if ((path == fields[1] or path.startswith(fields[1].rstrip('/') + '/'))
+                        and len(fields[1]) >= len(mount_point)):
+                    mount_point, fs_type = fields[1], fields[2]
+    except (IOError, OSError):
+        return False
+
+    return fs_type == 'tmpfs'
 
 class KoheronApp(Flask):
 
-    instruments_dirname = "/usr/local/instruments/"
-    live_instrument_dirname = "/tmp/live-instrument/"
+    # The directories can be moved with environment variables (used by the offline tests)
+    instruments_dirname = os.getenv('KOHERON_INSTRUMENTS_DIRNAME', "/usr/local/instruments/")
+    live_instrument_dirname = os.getenv('KOHERON_LIVE_INSTRUMENT_DIRNAME', "/tmp/live-instrument/")
     default_filename = "default"
     version_filename = "version"
+    catalog_dirname = ".catalog"
+    catalog_filename = "catalog.json"
+    uploads_dirname = ".uploads"
+    staging_dirname = os.getenv('KOHERON_STAGING_DIRNAME', "/tmp/instruments-cache/")
+
+    # Maximum size of the extracted instruments kept in staging_dirname (tmpfs)
+    max_staging_size = 64 * 1024 * 1024
+
+    # Age (seconds since the last chunk) after which an unfinished upload is removed
+    max_upload_age = 24 * 3600
+
+    # Number of finished install jobs kept for the status endpoint
+    max_finished_jobs = 32
 
     def __init__(self, *args, **kwargs):
         super(KoheronApp, self).__init__(*args, **kwargs)
+        self.metrics = Metrics()
+        self.staging_on_tmpfs = None # Checked on first use
         self.init_instruments(KoheronApp.instruments_dirname)
+        self.init_jobs()
 
-    def get_instrument_dict(self, instrument_filename, is_default, version_filename):
-
-        instrument = {}
-        instrument["name"] = get_name_from_zipfilename(instrument_filename)
+    def get_instrument_version(self, instrument_filename, version_filename):
 
         version = "0.0.0"
 
         if (is_file_in_zip(instrument_filename, version_filename)):
             version = read_file_in_zip(instrument_filename, version_filename).decode('utf8')
 
-        instrument["version"] = version
+        return version
+
+    def get_instrument_dict(self, instrument_filename, is_default, version_filename):
+
+        instrument = {}
+        instrument["name"] = get_name_from_zipfilename(instrument_filename)
+        instrument["version"] = self.get_instrument_version(instrument_filename, version_filename)
         instrument["is_default"] = is_default
 
         return instrument
@@ -77,35 +261,517 @@ class KoheronApp(Flask):
         else:
             return False
 
-    def init_instruments(self, instruments_dirname):
+    # ------------------------
+    # Catalog
+    # ------------------------
+
+    # The catalog stores the name of the default instrument and the version and
+    # SHA-256 of each archive, with the mtimes of the instruments directory and of the default file.
+    # When they are unchanged (no archive added, removed or renamed),
+    # the catalog is used as is. Otherwise only the new or modified archives are read.
+    # It is saved in a sub-directory, so that writing it does not change
+    # the mtime of the instruments directory.
+
+    def get_catalog_mtimes(self, instruments_dirname):
+
+        default_filename = os.path.join(instruments_dirname, KoheronApp.default_filename)
+        default_mtime = os.stat(default_filename).st_mtime if os.path.exists(default_filename) else None
+
+        return [os.stat(instruments_dirname).st_mtime, default_mtime]
+
+    def load_catalog(self, instruments_dirname):
+
+        catalog_filename = os.path.join(instruments_dirname, KoheronApp.catalog_dirname, KoheronApp.catalog_filename)
+
+        try:
+            with open(catalog_filename, 'r') as f:
+                catalog = json.load(f)
+        except (IOError, OSError, ValueError):
+            catalog = {}
+
+        if catalog.get("mtimes") != self.get_catalog_mtimes(instruments_dirname):
+            self.update_catalog(catalog, instruments_dirname)
+
+        return catalog
+
+    def update_catalog(self, catalog, instruments_dirname, changed_filenames=()):
 
-        self.instruments_list = []
+        """
+        Update the catalog from the instruments directory.
+        Only the archives that are new, listed in changed_filenames,
+        or whose size or mtime changed are read.
+        """
 
-        for filename in (x for x in os.listdir(instruments_dirname) if x.endswith(".zip")):
+        catalog_dirname = os.path.join(instruments_dirname, KoheronApp.catalog_dirname)
+
+        if not os.path.exists(catalog_dirname):
+            os.makedirs(catalog_dirname)
+
+        mtimes = self.get_catalog_mtimes(instruments_dirname)
+
+        default = None
+        if mtimes[1] is not None:
+            with open(os.path.join(instruments_dirname, KoheronApp.default_filename), 'r') as f:
+                default = f.read().rstrip('\n')
+
+        old_entries = catalog.get("instruments", {})
+        entries = {}
+
+        for filename in sorted(x for x in os.listdir(instruments_dirname) if is_zip(x)):
 
             instrument_filename = os.path.join(instruments_dirname, filename)
-            is_default = self.is_default_instrument(instrument_filename, instruments_dirname, KoheronApp.default_filename)
+            stat = os.stat(instrument_filename)
+            entry = old_entries.get(filename)
+
+            if (entry is None or filename in changed_filenames or "sha256" not in entry
+                or [entry["size"], entry["mtime"]] != [stat.st_size, stat.st_mtime]):
+                version = self.get_instrument_version(instrument_filename, KoheronApp.version_filename)
+                entry = {"size": stat.st_size, "mtime": stat.st_mtime, "version": version,
+                         "sha256": get_file_sha256(instrument_filename)}
+
+            entries[filename] = entry
+
+        catalog["mtimes"] = mtimes
+        catalog["default"] = default
+        catalog["instruments"] = entries
 
-            instrument = self.get_instrument_dict(instrument_filename, is_default, KoheronApp.version_filename)
+        catalog_filename = os.path.join(catalog_dirname, KoheronApp.catalog_filename)
+        tmp_filename = catalog_filename + '.tmp'
 
-            if instrument["name"] is not None:
+        with open(tmp_filename, 'w') as f:
+            json.dump(catalog, f)
+
+        os.rename(tmp_filename, catalog_filename)
+
+    def get_instruments_list(self, catalog):
+
+        instruments_list = []
+
+        for filename, entry in sorted(catalog["instruments"].items()):
+            instrument = {}
+            instrument["name"] = get_name_from_zipfilename(filename)
+            instrument["version"] = entry["version"]
+            instrument["is_default"] = (filename == catalog["default"])
+            instruments_list.append(instrument)
+
+        return instruments_list
+
+    def init_instruments(self, instruments_dirname):
 
-                self.instruments_list.append(instrument)
+        # The generation is incremented each time the instruments list or the
+        # live instrument changes (used for the ETag of the instruments API).
+        # The instance id makes the ETags of two runs of the app different.
+        self.instance_id = '{:x}'.format(int(time.time() * 1000))
+        self.generation = 0
+        self.last_modified = time.time()
 
-            if is_default:
+        self.catalog = self.load_catalog(instruments_dirname)
+        self.instruments_list = self.get_instruments_list(self.catalog)
 
+        for instrument in self.instruments_list:
+
+            if instrument["is_default"]:
+
+                instrument_filename = os.path.join(instruments_dirname, instrument["name"] + '.zip')
                 self.run_instrument(instrument_filename, KoheronApp.live_instrument_dirname, instrument)
 
+    def refresh_instruments(self, changed_filenames=()):
+
+        self.update_catalog(self.catalog, self.instruments_dirname, changed_filenames)
+        self.instruments_list = self.get_instruments_list(self.catalog)
+        self.increment_generation()
+
+    def increment_generation(self):
+
+        # Last-Modified has a resolution of one second: move to the next second
+        # so that If-Modified-Since never matches a previous generation.
+        self.generation += 1
+        self.last_modified = max(int(time.time()), int(self.last_modified) + 1)
+
+    # ------------------------
+    # Chunked uploads
+    # ------------------------
+
+    # An archive is uploaded in chunks to instruments_dirname/.uploads/<filename>.<sha256>.part.
+    # The part file is moved in instruments_dirname when all the bytes are received
+    # and its SHA-256 is checked. An interrupted upload resumes at the size of the part file.
+    # Starting an upload removes the parts of the other versions of the same archive
+    # and the parts not written for max_upload_age seconds.
+
+    def get_uploads_dirname(self):
+
+        uploads_dirname = os.path.join(self.instruments_dirname, KoheronApp.uploads_dirname)
+
+        if not os.path.exists(uploads_dirname):
+            os.makedirs(uploads_dirname)
+
+        return uploads_dirname
+
+    def get_part_filename(self, filename, sha256):
+
+        return os.path.join(self.get_uploads_dirname(), '{}.{}.part'.format(filename, sha256))
+
+    def get_part_filenames(self, filename=None):
+
+        """
+        Part files of the uploads of filename (of all the uploads if filename is None)
+        """
+
+        uploads_dirname = self.get_uploads_dirname()
+        part_filenames = []
+
+        for part in os.listdir(uploads_dirname):
+
+            if not part.endswith('.part'):
+                continue
+
+            # <filename>.<sha256>.part
+            if filename is None or (part.startswith(filename + '.') and len(part) == len(filename) + 70):
+                part_filenames.append(os.path.join(uploads_dirname, part))
+
+        return part_filenames
+
+    def remove_stale_uploads(self, filename, sha256):
+
+        """
+        Remove the parts of filename with another SHA-256 and the expired parts
+        """
+
+        keep_filename = self.get_part_filename(filename, sha256)
+        stale = set(self.get_part_filenames(filename))
+        expiry = time.time() - KoheronApp.max_upload_age
+
+        for part_filename in self.get_part_filenames():
+            try:
+                if os.stat(part_filename).st_mtime < expiry:
+                    stale.add(part_filename)
+            except OSError:
+                pass
+
+        stale.discard(keep_filename)
+
+        for part_filename in stale:
+            try:
+                os.remove(part_filename)
+            except OSError:
+                pass
+
+    def abort_upload(self, filename):
+
+        """
+        Remove the parts of the uploads of filename.
+        Returns the number of parts removed.
+        """
+
+        part_filenames = self.get_part_filenames(filename)
+
+        for part_filename in part_filenames:
+            os.remove(part_filename)
+
+        return len(part_filenames)
+
+    def start_upload(self, filename, size, sha256):
+
+        """
+        Returns the offset at which the upload must continue
+        (size if the same archive is already stored)
+        """
+
+        # The catalog may be stale if the archive was replaced outside of the API:
+        # get_instrument_sha256 only trusts it if the size and mtime still match.
+        stored_filename = os.path.join(self.instruments_dirname, filename)
+
+        if (os.path.isfile(stored_filename) and os.path.getsize(stored_filename) == size and
+                self.get_instrument_sha256(stored_filename) == sha256):
+            self.metrics.count('upload', 'unchanged')
+            return size
+
+        self.remove_stale_uploads(filename, sha256)
+        part_filename = self.get_part_filename(filename, sha256)
+
+        if not os.path.exists(part_filename):
+            open(part_filename, 'wb').close()
+
+        return os.path.getsize(part_filename)
+
+    def write_upload_chunk(self, filename, size, sha256, offset, chunk):
+
+        """
+        Append a chunk at offset to the part file.
+        Returns the offset of the next chunk.
+        Raises UploadOffsetError if the chunk is not at the end of the part file,
+        ValueError if the archive is invalid.
+        """
+
+        part_filename = self.get_part_filename(filename, sha256)
+        part_size = os.path.getsize(part_filename) if os.path.exists(part_filename) else 0
+
+        if offset != part_size:
+            raise UploadOffsetError(part_size)
+
+        if offset + len(chunk) > size:
+            raise ValueError('Chunk exceeds the archive size')
+
+        with self.metrics.timer('upload_chunk'):
+            with open(part_filename, 'ab') as f:
+                f.write(chunk)
+
+        self.metrics.add_upload_bytes(len(chunk))
+        offset += len(chunk)
+
+        # The duration of an upload is the time to check and store the archive
+        if offset == size:
+            with self.metrics.timer('upload') as timer:
+                if get_file_sha256(part_filename) != sha256:
+                    os.remove(part_filename)
+                    timer.status = 'failure'
+                    raise ValueError('SHA-256 mismatch')
+
+                os.rename(part_filename, os.path.join(self.instruments_dirname, filename))
+                self.refresh_instruments([filename])
+
+        return offset
+
+    # ------------------------
+    # Install jobs
+    # ------------------------
+
+    # Instruments are installed (or staged) by a background thread, one job
+    # at a time, in the order of the requests. A job is a dict:
+    # {"id", "name", "action" (install or stage),
+    #  "status" (queued, running, done or failed), "message",
+    #  "submitted", "started", "finished" (timestamps)}
+
+    def init_jobs(self):
+
+        self.jobs = OrderedDict()
+        self.jobs_lock = threading.RLock()
+        self.jobs_queue = queue.Queue()
+        self.job_ids = itertools.count(1)
+        self.jobs_worker = None
+        self.jobs_worker_pid = None
+
+    def start_jobs_worker(self):
+
+        """
+        Start the thread running the jobs if it is not running in this process.
+        The app is imported by the uWSGI master before the worker is forked,
+        and threads do not survive a fork: the thread is started on the first job.
+        """
+
+        with self.jobs_lock:
+
+            if self.jobs_worker is None or not self.jobs_worker.is_alive() or self.jobs_worker_pid != os.getpid():
+                self.jobs_worker = threading.Thread(target=self.run_jobs)
+                self.jobs_worker.daemon = True
+                self.jobs_worker.start()
+                self.jobs_worker_pid = os.getpid()
+
+    def submit_job(self, name, action="install"):
+
+        """
+        Queue the installation (or the staging) of instrument name.
+        Returns the same job already queued for this instrument if any.
+        """
+
+        with self.jobs_lock:
+
+            for job in self.jobs.values():
+                if job["name"] == name and job["action"] == action and job["status"] == "queued":
+                    return self.get_job(job["id"])
+
+            job = {"id": next(self.job_ids), "name": name, "action": action, "status": "queued", "message": "",
+                   "submitted": time.time(), "started": None, "finished": None}
+            self.jobs[job["id"]] = job
+
+            finished = [job_id for job_id, job in self.jobs.items() if job["finished"] is not None]
+            for job_id in finished[:max(0, len(finished) - KoheronApp.max_finished_jobs)]:
+                del self.jobs[job_id]
+
+        self.start_jobs_worker()
+        self.jobs_queue.put(job["id"])
+        return self.get_job(job["id"])
+
+    def get_job(self, job_id):
+
+        """
+        Copy of the job with its position in the queue (0 when not queued)
+        Returns None if the job does not exist.
+        """
+
+        with self.jobs_lock:
+
+            if job_id not in self.jobs:
+                return None
+
+            job = dict(self.jobs[job_id])
+            job["position"] = 0
+
+            if job["status"] == "queued":
+                queued = [x["id"] for x in self.jobs.values() if x["status"] == "queued"]
+                job["position"] = queued.index(job_id) + 1
+
+        return job
+
+    def get_jobs(self):
+
+        with self.jobs_lock:
+            return [self.get_job(job_id) for job_id in self.jobs]
+
+    def run_jobs(self):
+
+        while True:
+
+            job_id = self.jobs_queue.get()
+
+            with self.jobs_lock:
+                job = self.jobs[job_id]
+                job["status"] = "running"
+                job["started"] = time.time()
+
+            zip_filename = '{}.zip'.format(job["name"])
+            message = 'Failed to %s instrument %s' % (job["action"], zip_filename)
+
+            try:
+                filename = os.path.join(self.instruments_dirname, secure_filename(zip_filename))
+                if job["action"] == "stage":
+                    self.stage_instrument(filename)
+                    status = 'success'
+                else:
+                    is_default = self.is_default_instrument(filename, self.instruments_dirname, self.default_filename)
+                    instrument_dict = self.get_instrument_dict(filename, is_default, self.version_filename)
+                    status = self.run_instrument(filename, self.live_instrument_dirname, instrument_dict)
+            except Exception as e:
+                status = None
+                message = str(e)
+
+            if status == 'success':
+                message = 'Instrument %s successfully %s' % (zip_filename, 'staged' if job["action"] == "stage" else 'installed')
+
+            with self.jobs_lock:
+                job["status"] = "done" if status == 'success' else "failed"
+                job["message"] = message
+                job["finished"] = time.time()
+
+    # ------------------------
+    # Staging cache
+    # ------------------------
+
+    # The archives are extracted in staging_dirname/<sha256 of the archive>/
+    # and copied from there to the live instrument directory, so that running
+    # an instrument again does not decompress it.
+    # The least recently used instruments are removed when the cache
+    # is larger than max_staging_size (the live instrument is kept).
+    # The cache is only used if staging_dirname is on a tmpfs: otherwise
+    # the instruments are installed from their archive.
+
+    def get_instrument_sha256(self, instrument_filename):
+
+        stat = os.stat(instrument_filename)
+        entry = self.catalog["instruments"].get(os.path.basename(instrument_filename))
+
+        if entry is not None and "sha256" in entry and [entry["size"], entry["mtime"]] == [stat.st_size, stat.st_mtime]:
+            return entry["sha256"]
+
+        return get_file_sha256(instrument_filename)
+
+    def stage_instrument(self, instrument_filename):
+
+        """
+        Extract the instrument in the staging cache (if not already there)
+        Returns the directory of the extracted instrument.
+        """
+
+        if self.staging_on_tmpfs is None:
+            self.staging_on_tmpfs = is_tmpfs(os.path.dirname(KoheronApp.staging_dirname.rstrip('/')))
+
+        if not self.staging_on_tmpfs:
+            raise OSError('Staging directory {} is not on a tmpfs'.format(KoheronApp.staging_dirname))
+
+        staged_dirname = os.path.join(KoheronApp.staging_dirname, self.get_instrument_sha256(instrument_filename))
+
+        if not os.path.exists(KoheronApp.staging_dirname):
+            os.makedirs(KoheronApp.staging_dirname)
+
+        if os.path.exists(staged_dirname):
+            os.utime(staged_dirname, None) # Most recently used
+            self.metrics.count('staging_cache', 'hit')
+            return staged_dirname
+
+        self.metrics.count('staging_cache', 'miss')
+        tmp_dirname = staged_dirname + '.tmp'
+        shutil.rmtree(tmp_dirname, ignore_errors=True)
+
+        with self.metrics.timer('extract'):
+
+            with zipfile.ZipFile(instrument_filename) as archive:
+                archive.extractall(tmp_dirname)
+
+                # zipfile does not restore the permissions
+                for info in archive.infolist():
+                    mode = (info.external_attr >> 16) & 0o777
+                    if mode:
+                        os.chmod(os.path.join(tmp_dirname, info.filename), mode)
+
+        os.rename(tmp_dirname, staged_dirname)
+        self.evict_staged_instruments(staged_dirname)
+
+        return staged_dirname
+
+    def unstage_instrument(self, sha256):
+
+        """
+        Remove the extracted instrument of a deleted archive from the staging cache
+        (unless another archive has the same content)
+        """
+
+        if any(entry.get("sha256") == sha256 for entry in self.catalog["instruments"].values()):
+            return
+
+        shutil.rmtree(os.path.join(KoheronApp.staging_dirname, sha256), ignore_errors=True)
+
+    def evict_staged_instruments(self, keep_dirname):
+
+        staged = []
+
+        for dirname in os.listdir(KoheronApp.staging_dirname):
+            dirname = os.path.join(KoheronApp.staging_dirname, dirname)
+            staged.append((os.stat(dirname).st_mtime, dirname, get_dir_size(dirname)))
+
+        total_size = sum(size for _, _, size in staged)
+
+        for _, dirname, size in sorted(staged):
+
+            if total_size <= KoheronApp.max_staging_size:
+                break
+
+            if dirname not in (keep_dirname, getattr(self, 'live_staged_dirname', None)):
+                shutil.rmtree(dirname, ignore_errors=True)
+                total_size -= size
+
     def run_instrument(self, instrument_filename, live_instrument_dirname, instrument_dict):
 
         if not os.path.exists(instrument_filename):
             print('Instrument zip file not found.\nNo installation done.')
+            self.metrics.count('install', 'failure')
             return
         name = get_name_from_zipfilename(instrument_filename)
         print('Installing instrument ' + name)
-        subprocess.call(['/bin/bash', 'app/install_instrument.sh', name, live_instrument_dirname])
+
+        with self.metrics.timer('install'):
+
+            try:
+                staged_dirname = self.stage_instrument(instrument_filename)
+            except (OSError, IOError, zipfile.BadZipfile) as e:
+                print('Cannot stage instrument {}: {}'.format(name, e))
+                subprocess.call(['/bin/bash', 'app/install_instrument.sh', name, live_instrument_dirname])
+            else:
+                subprocess.call(['/bin/bash', 'app/install_instrument.sh', name, live_instrument_dirname, staged_dirname])
+                self.live_staged_dirname = staged_dirname
 
         self.live_instrument = instrument_dict
+        self.live_since = time.time()
+        self.increment_generation()
 
         return 'success'
 
@@ -115,79 +781,192 @@ app = KoheronApp(__name__)
 # Instruments
 # ------------------------
 
+def conditional_jsonify(build_response):
+
+    """
+    JSON response with ETag and Last-Modified headers given by the generation of the instruments.
+    Answers 304 Not Modified, without calling build_response,
+    if the client already has the current version.
+    """
+
+    etag = '{}-{}-{:x}'.format(app.instance_id, app.generation, zlib.crc32(request.query_string) & 0xffffffff)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = (request.if_modified_since is not None and
+                        calendar.timegm(request.if_modified_since.utctimetuple()) >= int(app.last_modified))
+
+    if not_modified:
+        response = make_response('', 304)
+    else:
+        response = jsonify(build_response())
+
+    response.set_etag(etag)
+    response.last_modified = app.last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def filter_fields(instrument):
+
+    """
+    Keep only the fields of the request parameter 'fields' (ex: ?fields=name,version)
+    """
+
+    fields = request.args.get('fields')
+
+    if fields is None or instrument is None:
+        return instrument
+
+    fields = fields.split(',')
+    return {key: value for key, value in instrument.items() if key in fields}
+
 @app.route('/api/instruments', methods=['GET'])
 def get_instruments_status():
-    instruments_status_list = []
-    for instrument in app.instruments_list:
-        instruments_status_list.append(instrument['name'])
-    instrument_status_live = app.live_instrument['name']
-    return jsonify({'instruments': instruments_status_list, 'live_instrument': instrument_status_live })
+    def build_response():
+        instruments_status_list = []
+        for instrument in app.instruments_list:
+            instruments_status_list.append(instrument['name'])
+        instrument_status_live = app.live_instrument['name']
+        return {'instruments': instruments_status_list, 'live_instrument': instrument_status_live }
+    return conditional_jsonify(build_response)
 
 @app.route('/api/instruments/details', methods=['GET'])
 def get_instruments_details():
-    return jsonify({'instruments': app.instruments_list, 'live_instrument': app.live_instrument })
+    def build_response():
+        return {'instruments': [filter_fields(instrument) for instrument in app.instruments_list],
+                'live_instrument': filter_fields(app.live_instrument) }
+    return conditional_jsonify(build_response)
 
 @app.route('/api/instruments/run/<name>', methods=['GET'])
 def run_instrument(name):
-    zip_filename = '{}.zip'.format(name)
-    filename = os.path.join(app.instruments_dirname, secure_filename(zip_filename))
-    is_default = app.is_default_instrument(os.path.join(app.instruments_dirname, secure_filename(filename)), app.instruments_dirname, app.default_filename)
-    instrument_dict = app.get_instrument_dict(filename, is_default, app.version_filename)
-    status = app.run_instrument(filename, app.live_instrument_dirname, instrument_dict)
-    if status == 'success':
-        response = 'Instrument %s successfully installed' % zip_filename
-    else:
-        response = 'Failed to install instrument %s' % zip_filename
-    return make_response(response)
+    job = app.submit_job(name)
+    return make_response(jsonify(job), 202)
+
+@app.route('/api/instruments/stage/<name>', methods=['GET'])
+def stage_instrument(name):
+    job = app.submit_job(name, action="stage")
+    return make_response(jsonify(job), 202)
+
+@app.route('/api/instruments/jobs', methods=['GET'])
+def get_jobs():
+    return jsonify({'jobs': app.get_jobs()})
+
+@app.route('/api/instruments/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = app.get_job(job_id)
+    if job is None:
+        return make_response(jsonify({'error': 'Job {} not found'.format(job_id)}), 404)
+    return jsonify(job)
 
 @app.route('/api/instruments/delete/<name>', methods=['GET'])
 def delete_instrument(name):
     zip_filename = secure_filename('{}.zip'.format(name))
 
-    instrument_filename = os.path.join(app.instruments_dirname, zip_filename)
-    if os.path.exists(instrument_filename):
-        os.remove(instrument_filename)
-
     for instrument in app.instruments_list:
 
-        if instrument["name"] == name:
+        if instrument["name"] == name and instrument["is_default"]:
 
-            if instrument["is_default"]:
-
-                return make_response('Default instrument cannot be removed')
+            return make_response('Default instrument cannot be removed')
 
-            else:
+    instrument_filename = os.path.join(app.instruments_dirname, zip_filename)
+    if os.path.exists(instrument_filename):
+        with app.metrics.timer('delete'):
+            sha256 = app.get_instrument_sha256(instrument_filename)
+            os.remove(instrument_filename)
+            app.refresh_instruments()
+            app.unstage_instrument(sha256)
+        return make_response('Instrument ' + zip_filename + ' removed.')
 
-                app.instruments_list.remove(instrument)
-                return make_response('Instrument ' + zip_filename + ' removed.')
+    return make_response('Instrument ' + zip_filename + ' not found.')
 
 @app.route('/api/instruments/upload', methods=['POST'])
 def upload_instrument():
     if request.method == 'POST':
         filename = next((filename for filename in request.files if is_zip(filename)), None)
         if filename is not None:
-            request.files[filename].save(os.path.join(app.instruments_dirname, secure_filename(filename)))
-
-            is_default = app.is_default_instrument(os.path.join(app.instruments_dirname, secure_filename(filename)), app.instruments_dirname, app.default_filename)
-            instrument = app.get_instrument_dict(os.path.join(app.instruments_dirname, secure_filename(filename)), is_default, app.version_filename)
+            with app.metrics.timer('upload'):
+                request.files[filename].save(os.path.join(app.instruments_dirname, secure_filename(filename)))
+                app.refresh_instruments([secure_filename(filename)])
 
-            is_instrument_in_list = False
+            return make_response('Instrument ' + filename + ' uploaded.')
+    return make_response('Instrument upload failed.')
 
-            for listed_instrument in app.instruments_list:
+def get_upload_params(filename):
 
-                if listed_instrument["name"] == instrument["name"]:
+    """
+    Returns the (filename, size, sha256) of a chunked upload
+    or None if the request parameters are invalid
+    """
 
-                    if listed_instrument["version"] != instrument["name"]:
+    filename = secure_filename(filename)
+    sha256 = request.args.get('sha256', '').lower()
+
+    try:
+        size = int(request.args.get('size', ''))
+    except ValueError:
+        return None
+
+    if not is_zip(filename) or size <= 0 or len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+        return None
+
+    return filename, size, sha256
+
+@app.route('/api/instruments/uploads/<filename>', methods=['POST'])
+def start_upload(filename):
+    params = get_upload_params(filename)
+    if params is None:
+        return make_response(jsonify({'error': 'Invalid upload parameters'}), 400)
+    offset = app.start_upload(*params)
+    return jsonify({'offset': offset, 'complete': offset == params[1]})
+
+@app.route('/api/instruments/uploads/<filename>', methods=['PUT'])
+def write_upload_chunk(filename):
+    params = get_upload_params(filename)
+    if params is None:
+        return make_response(jsonify({'error': 'Invalid upload parameters'}), 400)
+    try:
+        offset = app.write_upload_chunk(params[0], params[1], params[2], int(request.args.get('offset', '')), request.get_data())
+    except UploadOffsetError as e:
+        # The client continues at the expected offset
+        return make_response(jsonify({'error': str(e), 'offset': e.offset}), 409)
+    except ValueError as e:
+        return make_response(jsonify({'error': str(e)}), 400)
+    return jsonify({'offset': offset, 'complete': offset == params[1]})
+
+@app.route('/api/instruments/uploads/<filename>', methods=['DELETE'])
+def abort_upload(filename):
+    filename = secure_filename(filename)
+    if not is_zip(filename):
+        return make_response(jsonify({'error': 'Invalid upload parameters'}), 400)
+    return jsonify({'removed': app.abort_upload(filename)})
 
-                        app.instruments_list.remove(listed_instrument)
+# ------------------------
+# Metrics
+# ------------------------
 
-                    else:
+def get_gauges():
+    live_since = getattr(app, 'live_since', None)
+    gauges = {}
+    gauges['instruments'] = len(app.catalog["instruments"])
+    gauges['instruments_bytes'] = sum(entry["size"] for entry in app.catalog["instruments"].values())
+    gauges['live_instrument_uptime_seconds'] = 0 if live_since is None else time.time() - live_since
+    gauges['jobs_queued'] = app.jobs_queue.qsize()
+    return gauges
 
-                        is_instrument_in_list = True
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
 
-            if not (is_instrument_in_list):
+    """
+    Metrics in JSON, or in the Prometheus text format with ?format=prometheus
+    """
 
-                app.instruments_list.append(instrument)
+    if request.args.get('format') == 'prometheus':
+        response = make_response(app.metrics.to_prometheus(get_gauges()))
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+        return response
 
-            return make_response('Instrument ' + filename + ' uploaded.')
-    return make_response('Instrument upload failed.')
\ No newline at end of file
+    metrics = app.metrics.to_dict()
+    metrics['gauges'] = get_gauges()
+    metrics['live_instrument'] = app.live_instrument['name'] if hasattr(app, 'live_instrument') else None
+    return jsonify(metrics)
@@ -2,11 +2,17 @@
 
 NAME=$1
 LIVE_DIRNAME=$2
+# Directory of the instrument already extracted (optional)
+STAGED_DIRNAME=$3
 
 /bin/rm -rf ${LIVE_DIRNAME}
 /bin/mkdir -p ${LIVE_DIRNAME}
 
 /bin/systemctl stop koheron-server.service
-/usr/bin/unzip -o /usr/local/instruments/${NAME}.zip -d ${LIVE_DIRNAME}
+if [ -n "${STAGED_DIRNAME}" ]; then
+    /bin/cp -a ${STAGED_DIRNAME}/. ${LIVE_DIRNAME}
+else
+    /usr/bin/unzip -o /usr/local/instruments/${NAME}.zip -d ${LIVE_DIRNAME}
+fi
 /bin/systemctl start koheron-server.service
-/bin/systemctl start koheron-server-init.service
\ No newline at end of file
+/bin/systemctl start koheron-server-init.service
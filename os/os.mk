@@ -5,7 +5,7 @@
 # - Linux kernel
 include $(OS_PATH)/toolchain.mk
 
-BOARD := $(shell basename $(BOARD_PATH))
+BOARD := $(notdir $(BOARD_PATH))
 
 TMP_OS_PATH := $(TMP_PROJECT_PATH)/os
 
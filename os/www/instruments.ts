@@ -24,13 +24,15 @@ class Instruments {
         xhr.send(null);
     }
 
+    // The instrument is installed by a background job:
+    // the callback is called when the job is finished (with true on error)
     runInstrument(name: string, callback: (status: boolean) => void) : void {
         let xhr = new XMLHttpRequest();
         xhr.open('GET', '/api/instruments/run/' + name, true);
         xhr.onload = () => {
             if (xhr.readyState == 4) {
-                if (xhr.status == 200) {
-                    callback(false);
+                if (xhr.status == 202) {
+                    this.waitJob(JSON.parse(xhr.responseText).id, 50, callback);
                 }
                 else {
                     callback(true);
@@ -40,6 +42,26 @@ class Instruments {
         xhr.send(null);
     }
 
+    waitJob(id: number, period: number, callback: (status: boolean) => void) : void {
+        let xhr = new XMLHttpRequest();
+        xhr.open('GET', '/api/instruments/jobs/' + id.toString(), true);
+        xhr.onload = () => {
+            if (xhr.readyState == 4) {
+                if (xhr.status != 200) {
+                    callback(true);
+                    return;
+                }
+                let job = JSON.parse(xhr.responseText);
+                if (job.status == 'done' || job.status == 'failed') {
+                    callback(job.status == 'failed');
+                } else {
+                    setTimeout(() => {this.waitJob(id, Math.min(2 * period, 1000), callback)}, period);
+                }
+            }
+        }
+        xhr.send(null);
+    }
+
     uploadInstrument(file: File, callback: (status: boolean) => void): void {
 
         let formData = new FormData();
@@ -5,7 +5,12 @@ from .koheron import command
 from .koheron import ConnectionError
 from .koheron import connect
 from .koheron import run_instrument
+from .koheron import wait_instrument_job
+from .koheron import stage_instrument
 from .koheron import upload_instrument
 from .koheron import instrument_status
+from .koheron import get_metrics
+from .loop import ControlLoop
 from .alpha250 import Alpha250
+from .alpha250 import Alpha250Fleet
 
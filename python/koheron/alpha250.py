@@ -2,11 +2,63 @@
 # -*- coding: utf-8 -*-
 
 from koheron import command
+from koheron import KoheronClient
+import time
+import threading
 import numpy as np
 
+# Housekeeping values of a board (Alpha250.snapshot)
+snapshot_dtype = np.dtype([
+    ('time', '<f8'),                  # Unix time of the reception
+    ('serial_number', '<u4'),
+    ('temperatures', '<f4', (3,)),    # Voltage reference, board, Zynq (°C)
+    ('precision_adc', '<f4', (8,)),   # (V)
+    ('vcc_shunt_voltage', '<f4'),     # (V)
+    ('vcc_bus_voltage', '<f4'),       # (V)
+    ('clock_shunt_voltage', '<f4'),   # (V)
+    ('clock_bus_voltage', '<f4'),     # (V)
+    ('inputs', '<u4')                 # GPIO expander inputs
+])
+
+# field: (device, command, args)
+snapshot_commands = [
+    ('serial_number', ('Eeprom', 'get_serial_number', ())),
+    ('temperatures', ('TemperatureSensor', 'get_temperatures', ())),
+    ('precision_adc', ('PrecisionAdc', 'get_adc_values', ())),
+    ('vcc_shunt_voltage', ('PowerMonitor', 'get_shunt_voltage', (0,))),
+    ('vcc_bus_voltage', ('PowerMonitor', 'get_bus_voltage', (0,))),
+    ('clock_shunt_voltage', ('PowerMonitor', 'get_shunt_voltage', (1,))),
+    ('clock_bus_voltage', ('PowerMonitor', 'get_bus_voltage', (1,))),
+    ('inputs', ('GpioExpander', 'get_inputs', ()))
+]
+
 class Alpha250(object):
     def __init__(self, client):
         self.client = client
+        self.snapshot_request = None
+        self.snapshot_decoders = None
+        self.precision_dac_coeffs = None
+        self.precision_dac_header = None
+
+    # Housekeeping
+
+    def snapshot(self, out=None):
+        ''' Read all the housekeeping values in a single exchange
+
+        The commands are sent together and the responses are received in order.
+        Returns a record of type snapshot_dtype (or fills out).
+        '''
+        if self.snapshot_request is None:
+            prepared = [self.client.prepare(device, cmd, *args) for field, (device, cmd, args) in snapshot_commands]
+            self.snapshot_request = b''.join(cmd for cmd, decoder in prepared)
+            self.snapshot_decoders = [(field, decoder) for (field, _), (cmd, decoder) in zip(snapshot_commands, prepared)]
+
+        record = np.zeros((), dtype=snapshot_dtype)[()] if out is None else out
+        self.client.send_raw(self.snapshot_request)
+        for field, decoder in self.snapshot_decoders:
+            record[field] = decoder()
+        record['time'] = time.time()
+        return record
 
     # Clock generator
 
@@ -48,7 +100,56 @@ class Alpha250(object):
 
     @command(classname='PrecisionDac', funcname='set_calibration_coeffs')
     def set_precision_dac_calibration_coeffs(self, new_coeffs):
-        return self.client.recv_int32()
+        status = self.client.recv_int32()
+        # Returns -1 if the coefficients could not be written to the EEPROM:
+        # the cached coefficients are then read again from the board.
+        self.precision_dac_coeffs = np.asarray(new_coeffs, dtype='float32').reshape(-1, 2) if status >= 0 else None
+        return status
+
+    @command(classname='PrecisionDac', funcname='get_calibration_coeffs')
+    def get_precision_dac_calibration_coeffs(self):
+        return self.client.recv_array(8, dtype='float32')
+
+    @command(classname='PrecisionDac', funcname='set_dac_values')
+    def set_precision_dac_values(self, codes):
+        pass
+
+    def precision_dac_codes(self, voltages):
+        ''' DAC codes of voltages of shape (..., 4), with the calibration applied by numpy
+
+        The calibration coefficients are read from the board once.
+        Voltages are clipped to [0, 2.5] V as done by set_precision_dac_volts.
+        '''
+        if self.precision_dac_coeffs is None:
+            self.precision_dac_coeffs = self.get_precision_dac_calibration_coeffs().reshape(-1, 2)
+        voltages = np.asarray(voltages, dtype='float32')
+        if voltages.shape[-1:] != self.precision_dac_coeffs.shape[:1]:
+            raise ValueError('Expected {} voltages per step, got shape {}'.format(len(self.precision_dac_coeffs), voltages.shape))
+        if np.isnan(voltages).any():
+            raise ValueError('Precision DAC voltage is NaN')
+        voltages = np.clip(voltages, 0, 2.5)
+        codes = np.round(self.precision_dac_coeffs[:, 0] * voltages + self.precision_dac_coeffs[:, 1])
+        return np.clip(codes, 0, 0xFFFF).astype('uint32')
+
+    def set_precision_dac_volts_array(self, voltages):
+        ''' Set the voltages of all the channels with a single command '''
+        self.set_precision_dac_values(self.precision_dac_codes(voltages))
+
+    def sweep_precision_dac_volts(self, table):
+        ''' Apply a table of voltages of shape (n_steps, 4)
+
+        The codes of all the steps are computed at once and the commands
+        are sent in a single burst: the steps are applied as fast as the
+        server receives them, without a round trip per step.
+        '''
+        codes = self.precision_dac_codes(table).reshape(-1, len(self.precision_dac_coeffs))
+        if self.precision_dac_header is None:
+            cmd, decoder = self.client.prepare('PrecisionDac', 'set_dac_values', codes[0])
+            self.precision_dac_header = np.frombuffer(cmd[:8], dtype=np.uint8)
+        burst = np.empty((len(codes), 8 + codes.shape[1] * 4), dtype=np.uint8)
+        burst[:, :8] = self.precision_dac_header
+        burst[:, 8:] = codes.astype('<u4').view(np.uint8)
+        self.client.send_raw(burst.tobytes())
 
     # RF ADC
 
@@ -102,4 +203,79 @@ class Alpha250(object):
 
     @command(classname='Eeprom')
     def get_serial_number(self):
-        return self.client.recv_uint32()
\ No newline at end of file
+        return self.client.recv_uint32()
+
+class Alpha250Fleet(object):
+    ''' Poll the housekeeping snapshots of several boards
+
+    Each board is polled by its own thread every period seconds, and its
+    last history snapshots are kept in memory (rolling time series).
+    A board that does not respond is reconnected at the next period.
+
+    Example:
+        fleet = Alpha250Fleet(['192.168.1.10', '192.168.1.11'], period=0.1)
+        fleet.start()
+        temperatures = fleet.get('192.168.1.10')['temperatures']
+    '''
+    def __init__(self, hosts, period=0.1, history=600):
+        self.hosts = list(hosts)
+        self.period = period
+        self.history = history
+        self.series = {host: np.zeros(history, dtype=snapshot_dtype) for host in self.hosts}
+        self.counts = {host: 0 for host in self.hosts}
+        self.errors = {host: None for host in self.hosts}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        self.stop_event.clear()
+        self.threads = [threading.Thread(target=self.poll, args=(host,)) for host in self.hosts]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def poll(self, host):
+        board = None
+        record = np.zeros((), dtype=snapshot_dtype)[()]
+        deadline = time.time()
+        while not self.stop_event.is_set():
+            try:
+                if board is None:
+                    board = Alpha250(KoheronClient(host))
+                board.snapshot(out=record)
+                with self.lock:
+                    self.series[host][self.counts[host] % self.history] = record
+                    self.counts[host] += 1
+                    self.errors[host] = None
+            except Exception as e:
+                board = None
+                with self.lock:
+                    self.errors[host] = str(e)
+
+            # Next period (the periods already elapsed are skipped)
+            now = time.time()
+            deadline += self.period * max(1, int((now - deadline) / self.period) + 1)
+            self.stop_event.wait(deadline - now)
+
+    def get(self, host):
+        ''' Snapshots of a board, oldest first '''
+        with self.lock:
+            count = self.counts[host]
+            series = self.series[host]
+            if count <= self.history:
+                return series[:count].copy()
+            return np.roll(series, -(count % self.history))
+
+    def latest(self):
+        ''' Last snapshot of each board (None if the board never responded) '''
+        with self.lock:
+            return {host: (self.series[host][(self.counts[host] - 1) % self.history].copy()
+                           if self.counts[host] > 0 else None) for host in self.hosts}
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' Benchmarks of the link to koheron-server (koheron bench) '''
+
+import time
+import socket
+import platform
+import numpy as np
+
+from .koheron import KoheronClient, make_command, strip_ret_type, is_std_array, is_std_vector
+from .version import __version__
+
+clock = getattr(time, 'perf_counter', time.time)
+
+def summarize(durations):
+    ''' Statistics (in seconds) of a list of durations '''
+    durations = np.asarray(durations)
+    percentiles = np.percentile(durations, [50, 90, 99])
+    return {
+      'n': int(durations.size),
+      'mean': float(durations.mean()),
+      'std': float(durations.std()),
+      'min': float(durations.min()),
+      'p50': float(percentiles[0]),
+      'p90': float(percentiles[1]),
+      'p99': float(percentiles[2]),
+      'max': float(durations.max())
+    }
+
+def bench_latency(client, n=1000, warmup=10):
+    ''' Round-trip time of KServer::get_version '''
+    cmd = bytes(make_command(1, 0))
+
+    for _ in range(warmup):
+        client.send_raw(cmd)
+        client.recv_string(check_type=False)
+
+    durations = np.empty(n)
+    for i in range(n):
+        start = clock()
+        client.send_raw(cmd)
+        client.recv_string(check_type=False)
+        durations[i] = clock() - start
+
+    return summarize(durations)
+
+def bench_throughput(client, device_name, command_name, args=(), n_frames=100, depth=1):
+    ''' Throughput of a command returning a std::array or a std::vector
+
+    depth commands are in flight: a new command is sent each time a response is received.
+    '''
+    device_id, cmd_id, cmd_args = client.get_ids(device_name, command_name)
+    ret_type = strip_ret_type(client.cmds_ret_types_list[device_id][command_name])
+    if not (is_std_array(ret_type) or is_std_vector(ret_type)):
+        raise ValueError('{}::{} returns a {}, not an array or a vector.'.format(device_name, command_name, ret_type))
+
+    cmd, decoder = client.prepare(device_name, command_name, *args)
+
+    # Warm up, and size of a frame
+    client.send_raw(cmd)
+    frame_bytes = decoder().nbytes
+
+    n_sent = 0
+    n_bytes = 0
+    latencies = np.empty(n_frames)
+    sent_times = []
+
+    start = clock()
+    while n_sent < min(depth, n_frames):
+        sent_times.append(clock())
+        client.send_raw(cmd)
+        n_sent += 1
+
+    for i in range(n_frames):
+        n_bytes += decoder().nbytes
+        latencies[i] = clock() - sent_times[i]
+        if n_sent < n_frames:
+            sent_times.append(clock())
+            client.send_raw(cmd)
+            n_sent += 1
+
+    elapsed = clock() - start
+
+    return {
+      'frame_bytes': frame_bytes,
+      'frames': n_frames,
+      'seconds': elapsed,
+      'frames_per_second': n_frames / elapsed,
+      'bytes_per_second': n_bytes / elapsed,
+      'latency': summarize(latencies)
+    }
+
+def run_bench(host, n_latency=1000, command=None, args_list=((),), n_frames=100, depths=(1,), rcvbufs=(16384,)):
+    ''' Run the benchmarks on a host and return a report (dict)
+
+    Args:
+        command: 'Device.command' to measure the throughput (None to only measure the latency)
+        args_list: Arguments of the command, one set of arguments per payload size
+        depths: Numbers of commands in flight
+        rcvbufs: Sizes of the socket receive buffer
+
+    The throughput is measured for each (rcvbuf, depth) connection profile and each set of arguments.
+    '''
+    client = KoheronClient(host)
+    try:
+        client.send_raw(bytes(make_command(1, 0)))
+        server_version = client.recv_string(check_type=False)
+        latency = bench_latency(client, n_latency)
+    finally:
+        client.close()
+
+    report = {
+      'host': host,
+      'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+      'client': {'version': __version__, 'hostname': socket.gethostname(),
+                 'python': platform.python_version(), 'platform': platform.platform()},
+      'server_version': server_version,
+      'latency': latency,
+      'throughput': []
+    }
+
+    if command is not None:
+        device_name, command_name = command.split('.')
+        for rcvbuf in rcvbufs:
+            # One connection per receive buffer size
+            client = KoheronClient(host, rcvbuf=rcvbuf)
+            try:
+                for depth in depths:
+                    for args in args_list:
+                        result = bench_throughput(client, device_name, command_name, args, n_frames, depth)
+                        result.update({'command': command, 'rcvbuf': rcvbuf, 'depth': depth,
+                                       'args': [arg.tolist() if isinstance(arg, np.ndarray) else arg for arg in args]})
+                        report['throughput'].append(result)
+            finally:
+                client.close()
+
+    return report
@@ -1,19 +1,98 @@
+import sys
+import time
+import json
 import click
 
 # --------------------------------------------
-# Call koheron-server
+# Hosts
 # --------------------------------------------
 
 class ConnectionType(object):
-    def __init__(self, host="", unixsock=""):
-        self.host = host
+    def __init__(self, hosts=(), jobs=16, output_json=False):
+        self.hosts = list(hosts) or ['']
+        self.host = self.hosts[0]
+        self.jobs = jobs
+        self.output_json = output_json
+
+def expand_hosts(hosts, hosts_file=None):
+    ''' List of hosts from host names, CIDR ranges (ex: 192.168.1.0/28) and a file (one host or range per line) '''
+    entries = list(hosts)
+    if hosts_file is not None:
+        for line in hosts_file:
+            line = line.split('#')[0].strip()
+            if line:
+                entries.append(line)
+
+    expanded = []
+    for entry in entries:
+        if '/' in entry:
+            import ipaddress
+            network = ipaddress.ip_network(u'' + entry, strict=False)
+            expanded += [str(address) for address in (network.hosts() if network.num_addresses > 1 else network)]
+        else:
+            expanded.append(entry)
+
+    seen = set()
+    return [x for x in expanded if not (x in seen or seen.add(x))]
+
+def map_hosts(conn_type, func):
+    ''' Run func(host) on all the hosts with a pool of conn_type.jobs threads.
+
+    Returns the status ('ok' or 'error'), duration and result (or error
+    message) of each host, in the order of conn_type.hosts.
+    '''
+    def run(host):
+        start = time.time()
+        try:
+            status, result = 'ok', func(host)
+        except Exception as e:
+            status, result = 'error', str(e)
+        return {'host': host, 'status': status, 'time': time.time() - start, 'result': result}
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(max(1, min(conn_type.jobs, len(conn_type.hosts))))
+    results = pool.map(run, conn_type.hosts)
+    pool.close()
+    return results
+
+def run_on_hosts(conn_type, func):
+    ''' Run func(host) on all the hosts (see map_hosts).
+
+    With a single host, the result is printed as is (unless --json).
+    Otherwise the status, duration and result of each host are printed
+    in a table (or in JSON). Exits with status 1 if func failed on a host.
+    '''
+    if len(conn_type.hosts) == 1 and not conn_type.output_json:
+        result = func(conn_type.host)
+        if result is not None:
+            click.echo(result)
+        return
+
+    results = map_hosts(conn_type, func)
+
+    if conn_type.output_json:
+        click.echo(json.dumps(results, indent=2, default=str))
+    else:
+        width = max(len(result['host']) for result in results)
+        for result in results:
+            click.echo('{:<{}}  {:<5}  {:>7.2f} s  {}'.format(result['host'], width, result['status'], result['time'],
+                                                           '' if result['result'] is None else result['result']))
+
+    if any(result['status'] != 'ok' for result in results):
+        sys.exit(1)
 
 @click.group()
-@click.option('--host', default='', help='Host ip address', envvar='HOST')
+@click.option('--host', multiple=True, help='Host ip address (repeat the option for several hosts, or use a CIDR range)', envvar='HOST')
+@click.option('--hosts-file', type=click.File('r'), default=None, help='File with one host or CIDR range per line')
+@click.option('--jobs', default=16, help='Number of hosts processed concurrently')
+@click.option('--json', 'output_json', is_flag=True, help='Print the results of each host in JSON')
 @click.pass_context
-def cli(ctx, host):
-    if host != "":
-        ctx.obj = ConnectionType(host=str(host))
+def cli(ctx, host, hosts_file, jobs, output_json):
+    ctx.obj = ConnectionType(hosts=expand_hosts(host, hosts_file), jobs=jobs, output_json=output_json)
+
+# --------------------------------------------
+# Call koheron-server
+# --------------------------------------------
 
 @cli.command()
 def version():
@@ -26,8 +105,10 @@ def version():
 def devices(conn_type):
     ''' Get the list of devices '''
     from .koheron import KoheronClient
-    client = KoheronClient(host=conn_type.host)
-    click.echo(client.devices_idx)
+    def get_devices(host):
+        client = KoheronClient(host=host)
+        return client.devices_idx
+    run_on_hosts(conn_type, get_devices)
 
 @cli.command()
 @click.pass_obj
@@ -35,12 +116,166 @@ def devices(conn_type):
 def commands(conn_type, device):
     ''' Get the list of commands for a specified device '''
     from .koheron import KoheronClient
-    client = KoheronClient(host=conn_type.host)
-    if device is None:
-        click.echo(client.commands)
-    else:
-        device_idx = client.devices_idx[device]
-        click.echo(client.commands[device_idx])
+    def get_commands(host):
+        client = KoheronClient(host=host)
+        if device is None:
+            return client.commands
+        else:
+            device_idx = client.devices_idx[device]
+            return client.commands[device_idx]
+    run_on_hosts(conn_type, get_commands)
+
+def parse_arg(arg_type, string):
+    ''' Convert a command line argument to the type of a command argument
+
+    std::array and std::vector arguments are read from a .npy file
+    or from comma separated values.
+    '''
+    from .koheron import cpp_to_np_types, is_std_array, is_std_vector, is_std_string
+    from .koheron import get_std_array_params, get_std_vector_params, strip_ret_type
+    arg_type = strip_ret_type(arg_type)
+    if is_std_array(arg_type) or is_std_vector(arg_type):
+        params = get_std_array_params(arg_type) if is_std_array(arg_type) else get_std_vector_params(arg_type)
+        dtype = cpp_to_np_types[params['T']]
+        import numpy as np
+        if string.endswith('.npy'):
+            return np.load(string).astype(dtype, copy=False).ravel()
+        return np.array([parse_arg(params['T'], value) for value in string.split(',') if value.strip()], dtype=dtype)
+    if is_std_string(arg_type):
+        return string
+    if arg_type in ['float', 'double']:
+        return float(string)
+    if arg_type == 'bool':
+        return string.lower() in ['1', 'true', 'yes', 'on']
+    return int(string, 0)
+
+def parse_args(client, command, strings):
+    ''' Arguments of 'Device.command' from a list of strings '''
+    device_name, command_name = command.split('.')
+    cmd_args = client.get_ids(device_name, command_name)[2]
+    if len(strings) != len(cmd_args):
+        raise click.BadParameter('{} expects {} arguments ({})'.format(
+            command, len(cmd_args), ', '.join(arg['type'] + ' ' + arg['name'] for arg in cmd_args)))
+    return tuple(parse_arg(arg['type'], string) for arg, string in zip(cmd_args, strings))
+
+@cli.command()
+@click.pass_obj
+@click.option('--n', 'n_latency', default=1000, help='Number of get_version round trips')
+@click.option('--command', default=None, help='Device.command returning an array or a vector (throughput)')
+@click.option('--args', 'args_list', multiple=True, help='Arguments of the command separated by spaces (repeat for several payload sizes)')
+@click.option('--frames', default=100, help='Number of frames received per throughput measurement')
+@click.option('--depth', multiple=True, type=int, help='Number of commands in flight (repeat for several profiles)')
+@click.option('--rcvbuf', multiple=True, type=int, help='Socket receive buffer size (repeat for several profiles)')
+@click.option('--output', type=click.File('w'), default='-', help='JSON report file')
+def bench(conn_type, n_latency, command, args_list, frames, depth, rcvbuf, output):
+    ''' Measure the command latency and throughput of the hosts (JSON report) '''
+    from .koheron import KoheronClient
+    from .bench import run_bench
+
+    def bench_host(host):
+        parsed_args_list = [()]
+        if command is not None:
+            client = KoheronClient(host)
+            try:
+                parsed_args_list = [parse_args(client, command, args.split()) for args in args_list or ['']]
+            finally:
+                client.close()
+        return run_bench(host, n_latency, command, parsed_args_list, frames, depth or (1,), rcvbuf or (16384,))
+
+    results = map_hosts(conn_type, bench_host)
+    reports = [result['result'] if result['status'] == 'ok' else {'host': result['host'], 'error': result['result']}
+               for result in results]
+    output.write(json.dumps(reports, indent=2) + '\n')
+
+    if any(result['status'] != 'ok' for result in results):
+        sys.exit(1)
+
+def read_calls(batch_file):
+    ''' Calls of a batch file: one 'Device.command args...' per line ('#' starts a comment) '''
+    import shlex
+    calls = []
+    for line in batch_file:
+        words = shlex.split(line, comments=True)
+        if words:
+            calls.append((words[0], words[1:]))
+    return calls
+
+@cli.command(context_settings={'ignore_unknown_options': True}) # Negative numbers as arguments
+@click.pass_obj
+@click.argument('command', required=False)
+@click.argument('args', nargs=-1)
+@click.option('--batch', 'batch_file', type=click.File('r'), default=None, help='File with one call per line')
+@click.option('--output-dir', default='.', help='Directory of the .npy files of the returned arrays')
+@click.option('--depth', default=16, help='Number of calls in flight')
+def call(conn_type, command, args, batch_file, output_dir, depth):
+    ''' Call Device.command with the arguments ARGS
+
+    The arguments are converted to the types reported by the server.
+    Array arguments are .npy files or comma separated values.
+    Returned arrays are written to .npy files.
+    The calls of a batch file are pipelined over a single connection.
+    '''
+    import os
+    import numpy as np
+    from .koheron import KoheronClient
+
+    calls = [] if command is None else [(command, list(args))]
+    if batch_file is not None:
+        calls += read_calls(batch_file)
+    if not calls:
+        raise click.UsageError('Missing Device.command or --batch file')
+
+    def call_host(host):
+        client = KoheronClient(host)
+        parsed_calls = [tuple(name.split('.')) + (parse_args(client, name, strings),) for name, strings in calls]
+        results = client.pipeline(parsed_calls, depth)
+
+        dirname = os.path.join(output_dir, host) if len(conn_type.hosts) > 1 else output_dir
+        outputs = []
+        for i, ((name, strings), result) in enumerate(zip(calls, results)):
+            if isinstance(result, np.ndarray):
+                if not os.path.exists(dirname):
+                    os.makedirs(dirname)
+                filename = os.path.join(dirname, name + '.npy' if len(calls) == 1 else '{}_{}.npy'.format(i, name))
+                np.save(filename, result)
+                result = filename
+            elif isinstance(result, tuple):
+                result = list(result)
+            outputs.append(result)
+        return outputs[0] if len(calls) == 1 else outputs
+
+    run_on_hosts(conn_type, call_host)
+
+@cli.command(context_settings={'ignore_unknown_options': True})
+@click.pass_obj
+@click.argument('command')
+@click.argument('args', nargs=-1)
+@click.option('--rate', default=0., help='Frames per second (0: as fast as possible)')
+@click.option('--frames', default=None, type=int, help='Number of frames')
+@click.option('--duration', default=None, type=float, help='Duration in seconds')
+@click.option('--chunk-frames', default=1000, help='Number of frames per chunk file')
+@click.option('--output-dir', default='.', help='Directory of the chunk files')
+@click.option('--prefix', default=None, help='Prefix of the file names (default: Device.command)')
+@click.option('--queue', 'queue_size', default=256, help='Number of frames waiting to be written before frames are dropped')
+@click.option('--depth', default=4, help='Number of commands in flight (without --rate)')
+def record(conn_type, command, args, rate, frames, duration, chunk_frames, output_dir, prefix, queue_size, depth):
+    ''' Record the arrays returned by Device.command to .npy chunk files
+
+    Stops after --frames frames, --duration seconds or Ctrl-C.
+    Prints the statistics of the recording (late, missed and dropped frames).
+    '''
+    import os
+    from .koheron import KoheronClient
+    from .record import record as record_frames
+
+    def record_host(host):
+        client = KoheronClient(host)
+        dirname = os.path.join(output_dir, host) if len(conn_type.hosts) > 1 else output_dir
+        device_name, command_name = command.split('.')
+        return record_frames(client, device_name, command_name, parse_args(client, command, list(args)),
+                             dirname, prefix, rate, frames, duration, chunk_frames, queue_size, depth)
+
+    run_on_hosts(conn_type, record_host)
 
 # --------------------------------------------
 # Call HTTP API
@@ -53,7 +288,7 @@ def commands(conn_type, device):
 def upload(conn_type, instrument_zip, run):
     ''' Upload instrument.zip '''
     from .koheron import upload_instrument
-    upload_instrument(conn_type.host, instrument_zip, run=run)
+    run_on_hosts(conn_type, lambda host: upload_instrument(host, instrument_zip, run=run))
 
 @cli.command()
 @click.pass_obj
@@ -62,4 +297,49 @@ def upload(conn_type, instrument_zip, run):
 def run(conn_type, instrument_name, restart):
     ''' Run a given instrument '''
     from .koheron import run_instrument
-    run_instrument(conn_type.host, instrument_name, restart=restart)
+    def run_on_host(host):
+        job = run_instrument(host, instrument_name, restart=restart)
+        return None if job is None else job['message']
+    run_on_hosts(conn_type, run_on_host)
+
+@cli.command()
+@click.pass_obj
+@click.option('--prometheus', is_flag=True, help='Prometheus text format (with a host label)')
+def metrics(conn_type, prometheus):
+    ''' Get the metrics of the board API of one or several hosts '''
+    from .koheron import get_metrics
+
+    results = map_hosts(conn_type, lambda host: get_metrics(host, prometheus=prometheus))
+
+    if prometheus:
+        # Merge the metric families of all the hosts (samples labelled by host)
+        families = []
+        samples = {}
+        for result in results:
+            host = result['host']
+            if result['status'] != 'ok':
+                click.echo('# {}: {}'.format(host, result['result']), err=True)
+                continue
+            for line in result['result'].splitlines():
+                if line.startswith('#'):
+                    if line not in samples:
+                        families.append(line)
+                        samples[line] = []
+                    family = line
+                    continue
+                name, value = line.rsplit(' ', 1)
+                if name.endswith('}'):
+                    name = '{},host="{}"}}'.format(name[:-1], host)
+                else:
+                    name = '{}{{host="{}"}}'.format(name, host)
+                samples[family].append('{} {}'.format(name, value))
+        for family in families:
+            click.echo(family)
+            for sample in samples[family]:
+                click.echo(sample)
+    else:
+        click.echo(json.dumps({result['host']: (result['result'] if result['status'] == 'ok' else {'error': result['result']})
+                               for result in results}, indent=2, sort_keys=True))
+
+    if any(result['status'] != 'ok' for result in results):
+        sys.exit(1)
@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import copy
 import socket
+import hashlib
 import struct
 import numpy as np
 import string
@@ -17,19 +20,95 @@ ConnectionError = requests.ConnectionError
 # HTTP API
 # --------------------------------------------
 
+# Last instruments status by host: {host: (etag, status)}
+instrument_status_cache = {}
+
 def instrument_status(host):
-    status = requests.get('http://{}/api/instruments'.format(host)).json()
-    return status
+    ''' Status of the instruments (conditional request: the status is sent only if it changed) '''
+    etag, status = instrument_status_cache.get(host, (None, None))
+    headers = {} if etag is None else {'If-None-Match': etag}
+    r = requests.get('http://{}/api/instruments'.format(host), headers=headers)
+    if r.status_code != 304:
+        status = r.json()
+        instrument_status_cache[host] = (r.headers.get('ETag'), status)
+    return copy.deepcopy(status)
+
+def get_file_sha256(filename):
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def upload_instrument(host, filename, run=False, chunk_size=1024 * 1024):
+    ''' Upload an instrument archive in chunks.
+
+    The upload resumes where a previous interrupted upload stopped,
+    and nothing is sent if the server already stores the same archive.
+    The server checks the SHA-256 of the archive before storing it.
+    '''
+    size = os.path.getsize(filename)
+    params = {'size': size, 'sha256': get_file_sha256(filename)}
+    url = 'http://{}/api/instruments/uploads/{}'.format(host, os.path.basename(filename))
+
+    r = requests.post(url, params=params)
+
+    if r.status_code == 404:
+        # Server without chunked uploads
+        with open(filename, 'rb') as fileobj:
+            url = 'http://{}/api/instruments/upload'.format(host)
+            r = requests.post(url, files={filename: fileobj})
+    else:
+        r.raise_for_status()
+        offset = r.json()['offset']
+        with open(filename, 'rb') as fileobj:
+            while offset < size:
+                fileobj.seek(offset)
+                params['offset'] = offset
+                r = requests.put(url, params=params, data=fileobj.read(chunk_size))
+                if r.status_code != 409: # 409: continue at the offset expected by the server
+                    r.raise_for_status()
+                offset = r.json()['offset']
 
-def upload_instrument(host, filename, run=False):
-    with open(filename, 'rb') as fileobj:
-        url = 'http://{}/api/instruments/upload'.format(host)
-        r = requests.post(url, files={filename: fileobj})
     if run:
-        name = get_name_version(filename)
-        r = requests.get('http://{}/api/instruments/run/{}'.format(host, name))
-
-def run_instrument(host, name=None, restart=False):
+        name = os.path.splitext(os.path.basename(filename))[0]
+        run_instrument(host, name, restart=True)
+
+def abort_upload(host, filename):
+    ''' Remove the unfinished uploads of an instrument archive from the server.
+
+    Returns the number of partial uploads removed.
+    '''
+    r = requests.delete('http://{}/api/instruments/uploads/{}'.format(host, os.path.basename(filename)))
+    r.raise_for_status()
+    return r.json()['removed']
+
+def wait_instrument_job(host, job_id, timeout=60):
+    ''' Wait for the end of an install job. Returns the job status.
+
+    The job is polled with an increasing period (from 50 ms up to 1 s).
+    Raises RuntimeError if the install failed or did not end within timeout seconds.
+    '''
+    url = 'http://{}/api/instruments/jobs/{}'.format(host, job_id)
+    period = 0.05
+    deadline = time.time() + timeout
+    while True:
+        job = requests.get(url).json()
+        if job['status'] == 'done':
+            return job
+        if job['status'] == 'failed':
+            raise RuntimeError(job['message'])
+        if time.time() > deadline:
+            raise RuntimeError('Timeout while installing instrument {} ({})'.format(job['name'], job['status']))
+        time.sleep(period)
+        period = min(2 * period, 1.0)
+
+def run_instrument(host, name=None, restart=False, wait=True, timeout=60):
+    ''' Run an instrument of the store.
+
+    The server installs the instrument in the background: the install job
+    is returned without waiting if wait is False.
+    '''
     instrument_running = False
     instrument_in_store = False
     status = instrument_status(host)
@@ -52,6 +131,32 @@ def run_instrument(host, name=None, restart=False):
 
     if instrument_in_store or (instrument_running and restart):
         r = requests.get('http://{}/api/instruments/run/{}'.format(host, name))
+        try:
+            job = r.json()
+        except ValueError:
+            # Server without install jobs: the instrument is already installed
+            return None
+        if wait:
+            job = wait_instrument_job(host, job['id'], timeout=timeout)
+        return job
+
+def stage_instrument(host, name, wait=False, timeout=60):
+    ''' Extract an instrument of the store in the server cache, so that running it is faster '''
+    job = requests.get('http://{}/api/instruments/stage/{}'.format(host, name)).json()
+    if wait:
+        job = wait_instrument_job(host, job['id'], timeout=timeout)
+    return job
+
+def get_metrics(host, prometheus=False):
+    ''' Metrics of the board API (dict, or text in the Prometheus format) '''
+    url = 'http://{}/api/metrics'.format(host)
+    if prometheus:
+        r = requests.get(url, params={'format': 'prometheus'})
+        r.raise_for_status()
+        return r.text
+    r = requests.get(url)
+    r.raise_for_status()
+    return r.json()
 
 def connect(host, *args, **kwargs):
     run_instrument(host, *args, **kwargs)
@@ -87,7 +192,7 @@ def command(classname=None, funcname=None):
 
 def make_command(*args):
     buff = bytearray()
-    append(buff, 0, 4)        # RESERVED
+    append(buff, 0, 4)        # STREAM_FRAMES
     append(buff, args[0], 2)  # driver_id
     append(buff, args[1], 2)  # op_id
     # Payload
@@ -205,21 +310,127 @@ cpp_to_np_types = {
   'uint32_t': 'uint32', 'unsigned int': 'uint32',
   'int32_t': 'int32', 'int': 'int32',
   'uint64_t': 'uint64', 'int64_t': 'int64',
+  'unsigned long long': 'uint64', 'long long': 'int64',
+  'unsigned long': 'uint64', 'long': 'int64',
   'float': 'float32',
   'double': 'float64'
 }
 
+# The names demangled by the server depend on the target:
+# uint64_t is 'unsigned long long' on 32 bits ARM and 'unsigned long' on 64 bits ARM.
+cpp_to_struct_formats = {
+  'bool': '?',
+  'unsigned char': 'B', 'char': 'b', 'signed char': 'b',
+  'uint8_t': 'B', 'int8_t': 'b',
+  'uint16_t': 'H', 'int16_t': 'h',
+  'unsigned short': 'H', 'short': 'h',
+  'uint32_t': 'I', 'unsigned int': 'I',
+  'int32_t': 'i', 'int': 'i',
+  'uint64_t': 'Q', 'int64_t': 'q',
+  'unsigned long long': 'Q', 'long long': 'q',
+  'unsigned long': 'Q', 'long': 'q',
+  'float': 'f',
+  'double': 'd'
+}
+
+# --------------------------------------------
+# Precompiled encoders and decoders
+# --------------------------------------------
+
+def encode_array(array, dtype, length):
+    ''' Serialize a std::array argument '''
+    if len(array) != length:
+        raise ValueError('Invalid array length. Expected {} but received {}.'
+                         .format(length, len(array)))
+
+    if array.dtype != dtype:
+        raise TypeError('Invalid array type. Expected {} but received {}.'
+                        .format(dtype, array.dtype))
+
+    return array.tobytes()
+
+def encode_vector(array, dtype):
+    ''' Serialize a std::vector argument '''
+    if array.dtype != dtype:
+        raise TypeError('Invalid array type. Expected {} but received {}.'
+                        .format(dtype, array.dtype))
+
+    data = array.tobytes()
+    return struct.pack('>I', len(data)) + data
+
+def encode_string(string):
+    ''' Serialize a std::string argument '''
+    data = string.encode()
+    return struct.pack('>I', len(data)) + data
+
+def strip_ret_type(ret_type):
+    ''' ex: 'std::vector<float>' = strip_ret_type('const std::vector<float> &') '''
+    _type = ret_type.split('&')[0].strip()
+    if _type.startswith('const '):
+        _type = _type[len('const '):].strip()
+    return _type
+
+def get_std_tuple_params(_type):
+    templates = _type.split('<', 1)[1].rsplit('>', 1)[0].split(',')
+    return [template.strip() for template in templates]
+
+def build_ret_decoder(ret_type, ret_size=None):
+    ''' Build the decoder of a command return value from its C++ type.
+
+    The decoder is a function taking the client as argument.
+    The type string is only parsed once, when the decoder is built.
+    Arrays are received directly into the buffer of the returned numpy array.
+    When the response size is given (ret_size in the command schema),
+    it is checked against the array type.
+    '''
+    _type = strip_ret_type(ret_type)
+
+    if _type == 'void':
+        return lambda client: None
+
+    if _type in cpp_to_struct_formats:
+        ret_struct = struct.Struct('>IHH' + cpp_to_struct_formats[_type])
+        return lambda client: client.recv_struct(ret_struct)[0]
+
+    if is_std_array(_type):
+        params = get_std_array_params(_type)
+        dtype = cpp_to_np_types[params['T']]
+        size = int(params['N']) * np.dtype(dtype).itemsize
+        if ret_size is not None and ret_size != size:
+            raise ValueError('Invalid response size for {}: expected {} bytes but the server sends {} bytes.'
+                             .format(ret_type, size, ret_size))
+        dtype = np.dtype(dtype).newbyteorder('<')
+        return lambda client: np.frombuffer(client.recv_fixed(size), dtype=dtype)
+
+    if is_std_vector(_type):
+        dtype = cpp_to_np_types[get_std_vector_params(_type)['T']]
+        return lambda client: client.recv_vector(dtype=dtype, check_type=False)
+
+    if is_std_string(_type) or _type in ['char *', 'char*'] or 'basic_string' in _type:
+        return lambda client: client.recv_string(check_type=False)
+
+    if is_std_tuple(_type):
+        params = get_std_tuple_params(_type)
+        if not all(T in cpp_to_struct_formats for T in params):
+            raise TypeError('Unsupported return type "{}"'.format(ret_type))
+        fmt = ''.join(cpp_to_struct_formats[T] for T in params)
+        ret_struct = struct.Struct('>IHH' + fmt)
+        return lambda client: client.recv_struct(ret_struct)
+
+    raise TypeError('Unsupported return type "{}"'.format(ret_type))
+
 # --------------------------------------------
 # KoheronClient
 # --------------------------------------------
 
 class KoheronClient:
-    def __init__(self, host='', port=36000, unixsock=''):
+    def __init__(self, host='', port=36000, unixsock='', rcvbuf=16384):
         ''' Initialize connection with koheron-server
 
         Args:
             host: A string with the IP address
             port: Port of the TCP connection (must be an integer)
+            rcvbuf: Size of the socket receive buffer (TCP only)
         '''
         if type(host) != str:
             raise TypeError('IP address must be a string')
@@ -231,13 +442,14 @@ class KoheronClient:
         self.port = port
         self.unixsock = unixsock
         self.is_connected = False
+        self.req_sizes = {}
 
         if host != '':
             try:
                 self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
                 # Prevent delayed ACK on Ubuntu
-                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
                 so_rcvbuf = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
 
                 #   Disable Nagle algorithm for real-time response:
@@ -289,19 +501,29 @@ class KoheronClient:
         self.cmds_idx_list = [None]*(2 + len(self.commands))
         self.cmds_args_list = [None]*(2 + len(self.commands))
         self.cmds_ret_types_list = [None]*(2 + len(self.commands))
+        self.cmds_stream_list = [None]*(2 + len(self.commands))
+        self.cmds_sizes_list = [None]*(2 + len(self.commands))
+        self.req_sizes = {}
 
         for device in self.commands:
             self.devices_idx[device['class']] = device['id']
             cmds_idx = {}
             cmds_args = {}
             cmds_ret_type = {}
+            cmds_stream = {}
+            cmds_sizes = {}
             for cmd in device['functions']:
                 cmds_idx[cmd['name']] = cmd['id']
                 cmds_args[cmd['name']] = cmd['args']
                 cmds_ret_type[cmd['name']] = cmd.get('ret_type', None)
+                cmds_stream[cmd['name']] = cmd.get('stream', False)
+                cmds_sizes[cmd['name']] = (cmd.get('req_size'), cmd.get('ret_size'))
+                self.req_sizes[(device['id'], cmd['id'])] = cmd.get('req_size')
             self.cmds_idx_list[device['id']] = cmds_idx
             self.cmds_args_list[device['id']] = cmds_args
             self.cmds_ret_types_list[device['id']] = cmds_ret_type
+            self.cmds_stream_list[device['id']] = cmds_stream
+            self.cmds_sizes_list[device['id']] = cmds_sizes
 
     def get_ids(self, device_name, command_name):
         device_id = self.devices_idx[device_name]
@@ -336,6 +558,30 @@ class KoheronClient:
         if dtype != cpp_to_np_types[vect_type]:
             raise TypeError('{}::{} expects elements of type {}.'.format(self.last_device_called, self.last_cmd_called, vect_type))
 
+    def check_device(self, device_name, device_id):
+        ''' Check that the server exposes device_name with the id device_id '''
+        if self.devices_idx.get(device_name) != device_id:
+            raise ValueError('Device {} not found with id {} [available devices: {}].'
+                             .format(device_name, device_id, self.devices_idx))
+
+    def get_array_length(self, device_name, command_name, arg_name):
+        ''' Length of a std::array argument as reported by the server '''
+        device_id, cmd_id, cmd_args = self.get_ids(device_name, command_name)
+        arg = next(arg for arg in cmd_args if arg['name'] == arg_name)
+        return int(get_std_array_params(arg['type'])['N'])
+
+    def get_sizes(self, device_name, command_name):
+        ''' Request and response payload sizes in bytes (None if dynamic) '''
+        device_id = self.devices_idx[device_name]
+        return self.cmds_sizes_list[device_id][command_name]
+
+    def get_ret_decoder(self, device_name, command_name):
+        ''' Return decoder built from the return type reported by the server '''
+        device_id = self.devices_idx[device_name]
+        decoder = build_ret_decoder(self.cmds_ret_types_list[device_id][command_name],
+                                    self.cmds_sizes_list[device_id][command_name][1])
+        return lambda: decoder(self)
+
     # TODO add types check
     def check_ret_tuple(self):
         device_id = self.devices_idx[self.last_device_called]
@@ -349,9 +595,125 @@ class KoheronClient:
 
     def send_command(self, device_id, cmd_id, cmd_args=[], *args):
         cmd = make_command(device_id, cmd_id, cmd_args, *args)
+        req_size = self.req_sizes.get((device_id, cmd_id))
+        if req_size is not None and len(cmd) - 8 != req_size:
+            raise ValueError('Invalid request size for command {} of device {}. Expected {} bytes but received {} bytes.'
+                             .format(cmd_id, device_id, req_size, len(cmd) - 8))
         if self.sock.send(cmd) == 0:
             raise ConnectionError('send_command: Socket connection broken')
 
+    def send_raw(self, cmd):
+        ''' Send an already serialized command '''
+        try:
+            self.sock.sendall(cmd)
+        except Exception:
+            raise ConnectionError('send_raw: Socket connection broken')
+
+    def stream_frames(self, cmd, decoder, count=None, batch=16):
+        ''' Iterate over the frames pushed by a stream source
+
+        Args:
+            cmd: Serialized command of the stream source
+            decoder: Function receiving one frame
+            count: Number of frames (None streams until the iterator is closed)
+            batch: Number of frames requested by each subscription
+
+        The subscription is renewed before the previous one is exhausted,
+        so that the server always has frames to push.
+        No other command can be sent while the iterator is open.
+        '''
+        cmd = bytearray(cmd)
+        requested = 0
+        received = 0
+        try:
+            while count is None or received < count:
+                if requested - received <= batch and (count is None or requested < count):
+                    n_frames = batch if count is None else min(batch, count - requested)
+                    cmd[:4] = struct.pack('>I', n_frames)
+                    self.send_raw(cmd)
+                    requested += n_frames
+                frame = decoder()
+                received += 1
+                yield frame
+        finally:
+            # Drain the frames still in flight to keep the socket in sync
+            for _ in range(requested - received):
+                decoder()
+
+    def stream(self, device_name, command_name, args=(), count=None, batch=16):
+        ''' Iterate over the frames pushed by device_name::command_name '''
+        device_id, cmd_id, cmd_args = self.get_ids(device_name, command_name)
+        if not self.cmds_stream_list[device_id][command_name]:
+            raise ValueError('{}::{} is not a stream source.'.format(device_name, command_name))
+        cmd = make_command(device_id, cmd_id, cmd_args, *args)
+        decoder = build_ret_decoder(self.cmds_ret_types_list[device_id][command_name],
+                                    self.cmds_sizes_list[device_id][command_name][1])
+        return self.stream_frames(cmd, lambda: decoder(self), count, batch)
+
+    def prepare(self, device_name, command_name, *args):
+        ''' Serialize a command and build the decoder of its return value
+
+        Returns (cmd, decoder): send cmd with send_raw, then call decoder()
+        to receive the return value. cmd can be sent several times.
+        '''
+        device_id, cmd_id, cmd_args = self.get_ids(device_name, command_name)
+        cmd = make_command(device_id, cmd_id, cmd_args, *args)
+        req_size = self.req_sizes.get((device_id, cmd_id))
+        if req_size is not None and len(cmd) - 8 != req_size:
+            raise ValueError('Invalid request size for {}::{}. Expected {} bytes but received {} bytes.'
+                             .format(device_name, command_name, req_size, len(cmd) - 8))
+        decoder = build_ret_decoder(self.cmds_ret_types_list[device_id][command_name],
+                                    self.cmds_sizes_list[device_id][command_name][1])
+        return bytes(cmd), lambda: decoder(self)
+
+    def call(self, device_name, command_name, *args):
+        ''' Execute device_name::command_name and return its decoded return value '''
+        cmd, decoder = self.prepare(device_name, command_name, *args)
+        self.send_raw(cmd)
+        return decoder()
+
+    def pipeline(self, calls, depth=16):
+        ''' Execute several commands with up to depth commands in flight
+
+        Args:
+            calls: List of (device_name, command_name, args)
+
+        All the commands are serialized before the first one is sent.
+        Returns the list of the decoded return values.
+        '''
+        prepared = [self.prepare(device_name, command_name, *args) for device_name, command_name, args in calls]
+        results = []
+        n_sent = 0
+        while len(results) < len(prepared):
+            while n_sent < len(prepared) and n_sent - len(results) < depth:
+                self.send_raw(prepared[n_sent][0])
+                n_sent += 1
+            results.append(prepared[len(results)][1]())
+        return results
+
+    def batch(self):
+        ''' Start a batch of commands executed in a single round trip '''
+        return Batch(self)
+
+    def execute_batch(self, commands, decoders):
+        ''' Execute serialized commands in a single request
+
+        Args:
+            commands: List of serialized commands
+            decoders: Return value decoder of each command
+
+        Returns the list of the decoded return values.
+        '''
+        # Each command is framed with the length of its payload
+        entries = b''.join(cmd[:8] + struct.pack('>I', len(cmd) - 8) + cmd[8:] for cmd in commands)
+        self.send_raw(struct.pack('>IHHII', 0, 1, 2, len(commands), len(entries)) + entries)
+        reserved, class_id, func_id, n_executed, length = struct.unpack('>IHHII', self.recv_all(struct.calcsize('>IHHII')))
+        reader = ResponseReader(self.recv_all(length))
+        results = [decoder(reader) for decoder in decoders[:n_executed]]
+        if n_executed < len(commands):
+            raise RuntimeError('Batch command {} failed'.format(n_executed))
+        return results
+
     def recv_all(self, n_bytes):
         '''Receive exactly n_bytes bytes.'''
         data = []
@@ -368,6 +730,26 @@ class KoheronClient:
                 raise ConnectionError('recv_all: Socket connection broken.')
         return b''.join(data)
 
+    def recv_fixed(self, size):
+        ''' Receive a response with a payload of known size
+
+        The response is received in place into a single buffer of the
+        exact size (no intermediate chunks to join).
+        Returns a writable view on the payload.
+        '''
+        buff = bytearray(8 + size)
+        view = memoryview(buff)
+        n_rcv = 0
+        while n_rcv < len(buff):
+            try:
+                n_bytes = self.sock.recv_into(view[n_rcv:])
+            except Exception:
+                raise ConnectionError('recv_fixed: Socket connection broken.')
+            if n_bytes == 0:
+                raise ConnectionError('recv_fixed: Socket connection broken.')
+            n_rcv += n_bytes
+        return view[8:]
+
     def recv_dynamic_payload(self):
         reserved, class_id, func_id, length = struct.unpack('>IHHI', self.recv_all(struct.calcsize('>IHHI')))
         assert reserved == 0
@@ -381,6 +763,10 @@ class KoheronClient:
         else:
             return t
 
+    def recv_struct(self, ret_struct):
+        ''' Receive scalars with a precompiled struct.Struct('>IHH...') '''
+        return ret_struct.unpack(self.recv_all(ret_struct.size))[3:]
+
     def recv_int8(self):
         self.check_ret_type(['int8_t', 'char', 'signed char'])
         return self.recv(fmt='b')
@@ -445,8 +831,7 @@ class KoheronClient:
         if check_type:
             self.check_ret_array(dtype, arr_len)
         dtype = np.dtype(dtype)
-        self.recv(fmt='')
-        buff = self.recv_all(dtype.itemsize * arr_len)
+        buff = self.recv_fixed(dtype.itemsize * arr_len)
         return np.frombuffer(buff, dtype=dtype.newbyteorder('<')).reshape(shape)
 
     def recv_tuple(self, fmt, check_type=True):
@@ -454,6 +839,72 @@ class KoheronClient:
             self.check_ret_tuple()
         return tuple(self.recv(fmt))
 
+    def close(self):
+        ''' Close the connection with koheron-server '''
+        if hasattr(self, 'sock'):
+            self.sock.close()
+        self.is_connected = False
+
     def __del__(self):
         if hasattr(self, 'sock'):
             self.sock.close()
+
+class ResponseReader(object):
+    ''' Decode the responses of a batch from the received payload
+
+    Implements the receive functions used by the return value decoders
+    (see build_ret_decoder).
+    '''
+    def __init__(self, payload):
+        self.payload = memoryview(payload)
+        self.position = 0
+
+    def recv_all(self, n_bytes):
+        if self.position + n_bytes > len(self.payload):
+            raise ConnectionError('recv_all: Truncated batch response.')
+        data = self.payload[self.position:self.position + n_bytes].tobytes()
+        self.position += n_bytes
+        return data
+
+    def recv_fixed(self, size):
+        return memoryview(bytearray(self.recv_all(8 + size)))[8:]
+
+    def recv_struct(self, ret_struct):
+        return ret_struct.unpack(self.recv_all(ret_struct.size))[3:]
+
+    def recv_dynamic_payload(self):
+        reserved, class_id, func_id, length = struct.unpack('>IHHI', self.recv_all(struct.calcsize('>IHHI')))
+        return self.recv_all(length)
+
+    def recv_vector(self, dtype='uint32', check_type=False):
+        return np.frombuffer(self.recv_dynamic_payload(), dtype=np.dtype(dtype).newbyteorder('<'))
+
+    def recv_string(self, check_type=False):
+        return self.recv_dynamic_payload().decode('utf8')
+
+class Batch(object):
+    ''' Commands executed by the server in a single request
+
+    Example:
+        x, y = client.batch().add('Device', 'get_x').add('Device', 'get_y', 42).execute()
+
+    A batch can be executed several times.
+    '''
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+        self.decoders = []
+
+    def add(self, device_name, command_name, *args):
+        device_id, cmd_id, cmd_args = self.client.get_ids(device_name, command_name)
+        req_size, ret_size = self.client.cmds_sizes_list[device_id][command_name]
+        cmd = make_command(device_id, cmd_id, cmd_args, *args)
+        if req_size is not None and len(cmd) - 8 != req_size:
+            raise ValueError('Invalid request size for {}::{}. Expected {} bytes but received {} bytes.'
+                             .format(device_name, command_name, req_size, len(cmd) - 8))
+        self.commands.append(bytes(cmd))
+        self.decoders.append(build_ret_decoder(self.client.cmds_ret_types_list[device_id][command_name], ret_size))
+        return self
+
+    def execute(self):
+        return self.client.execute_batch(self.commands, self.decoders)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' Fixed-rate control loop on top of KoheronClient '''
+
+import math
+import time
+import threading
+import numpy as np
+
+from .koheron import strip_ret_type
+from .bench import summarize
+
+clock = getattr(time, 'perf_counter', time.time)
+
+# Bins of the timing histograms (seconds): 1 us to 1 s
+histogram_bins = np.logspace(-6, 0, 31)
+
+def timing_stats(durations):
+    ''' Statistics and histogram of a list of durations (seconds) '''
+    durations = np.asarray(durations)
+    if durations.size == 0:
+        return None
+    stats = summarize(durations)
+    counts, edges = np.histogram(durations, bins=histogram_bins)
+    stats['histogram'] = {
+      'edges': edges.tolist(),
+      'counts': counts.tolist(),
+      'below': int((durations < edges[0]).sum()),
+      'above': int((durations > edges[-1]).sum())
+    }
+    return stats
+
+class ControlLoop(object):
+    ''' Run a callback at a fixed rate
+
+    At each deadline, the read commands are sent together and their values
+    are passed to callback(values, t), where t is the time since the start
+    of the loop. The callback returns the arguments of each write command:
+    a single argument, or a tuple or list of arguments (pass an array
+    argument as a numpy array). None skips a write, or all the writes.
+    The writes are sent at once and their responses, if any, are only
+    received with the next reads.
+
+    Example:
+        def regulate(values, t):
+            power, = values
+            return [current + gain * (setpoint - power)]
+
+        loop = ControlLoop(client, 1000, [('Laser', 'get_measured_power')],
+                           [('Laser', 'set_current')], regulate)
+        stats = loop.run(duration=10)
+
+    The deadlines are start + k / rate. An iteration that ends after the
+    next deadline is an overrun: the deadlines already passed are missed
+    and the loop resumes at the next one, so it does not drift.
+    '''
+    def __init__(self, client, rate, reads, writes, callback):
+        self.client = client
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.callback = callback
+        self.stop_event = threading.Event()
+
+        # Reads: (device, command[, args])
+        prepared = [client.prepare(read[0], read[1], *(read[2] if len(read) > 2 else ())) for read in reads]
+        self.read_request = b''.join(cmd for cmd, decoder in prepared)
+        self.read_decoders = [decoder for cmd, decoder in prepared]
+
+        # Writes: (device, command), serialized at each iteration
+        self.writes = []
+        for device_name, command_name in writes:
+            device_id = client.get_ids(device_name, command_name)[0]
+            has_response = strip_ret_type(client.cmds_ret_types_list[device_id][command_name]) != 'void'
+            self.writes.append((device_name, command_name, has_response))
+
+    def stop(self):
+        ''' Stop the loop at the end of the current iteration (can be called from the callback) '''
+        self.stop_event.set()
+
+    def run(self, n_iterations=None, duration=None):
+        ''' Run the loop until n_iterations, duration seconds, stop() or Ctrl-C
+
+        Returns the statistics of the loop (dict):
+            jitter: delay between the deadline and the start of the iteration
+            period: time between the starts of consecutive iterations
+            latency: round trip time of the read commands
+            callback: duration of the callback
+            overruns: number of iterations that ended after the next deadline
+            missed: number of deadlines skipped after the overruns
+        '''
+        self.stop_event.clear()
+        jitters = []
+        periods = []
+        latencies = []
+        callback_times = []
+        overruns = 0
+        missed = 0
+        in_flight = [] # Decoders of the responses not received yet (in order)
+
+        k = 0
+        start = clock()
+        last_start = None
+        try:
+            while not self.stop_event.is_set():
+                if n_iterations is not None and len(jitters) >= n_iterations:
+                    break
+                deadline = start + k * self.period
+                if duration is not None and deadline - start >= duration:
+                    break
+                now = clock()
+                if now < deadline:
+                    time.sleep(deadline - now)
+
+                t_start = clock()
+                jitters.append(t_start - deadline)
+                if last_start is not None:
+                    periods.append(t_start - last_start)
+                last_start = t_start
+
+                self.client.send_raw(self.read_request)
+                in_flight.extend(self.read_decoders)
+                responses = []
+                while in_flight:
+                    responses.append(in_flight[0]())
+                    del in_flight[0]
+                values = responses[len(responses) - len(self.read_decoders):]
+                t_read = clock()
+                latencies.append(t_read - t_start)
+
+                outputs = self.callback(values, t_start - start)
+                callback_times.append(clock() - t_read)
+
+                if outputs is not None:
+                    cmds = []
+                    decoders = []
+                    for (device_name, command_name, has_response), args in zip(self.writes, outputs):
+                        if args is None:
+                            continue
+                        if not isinstance(args, (tuple, list)):
+                            args = (args,)
+                        cmd, decoder = self.client.prepare(device_name, command_name, *args)
+                        cmds.append(cmd)
+                        if has_response:
+                            decoders.append(decoder)
+                    if cmds:
+                        self.client.send_raw(b''.join(cmds))
+                        in_flight.extend(decoders)
+
+                k += 1
+                t_end = clock()
+                if t_end > start + k * self.period:
+                    overruns += 1
+                    next_k = int(math.ceil((t_end - start) / self.period))
+                    missed += next_k - k
+                    k = next_k
+        except KeyboardInterrupt:
+            pass
+
+        # Keep the socket in sync: receive the responses of the reads and writes in flight
+        for decoder in in_flight:
+            decoder()
+
+        elapsed = clock() - start
+        return {
+          'rate': self.rate,
+          'iterations': len(jitters),
+          'seconds': elapsed,
+          'achieved_rate': len(jitters) / elapsed if elapsed > 0 else 0,
+          'overruns': overruns,
+          'missed': missed,
+          'jitter': timing_stats(jitters),
+          'period': timing_stats(periods),
+          'latency': timing_stats(latencies),
+          'callback': timing_stats(callback_times)
+        }
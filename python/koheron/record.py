@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' Data logger of a command returning an array (koheron record)
+
+The frames are written to chunk files <prefix>_<n>.npy of chunk_frames
+frames each, preallocated as memory maps. Each chunk has a timestamp
+index <prefix>_<n>_time.npy with the frame number and the reception
+time (Unix time) of each frame. The chunk files and the statistics of
+the recording are listed in <prefix>.json.
+'''
+
+import os
+import json
+import time
+import threading
+import numpy as np
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .koheron import strip_ret_type, is_std_array, is_std_vector
+
+clock = getattr(time, 'perf_counter', time.time)
+
+time_dtype = np.dtype([('index', '<u8'), ('time', '<f8')])
+
+class ChunkWriter(threading.Thread):
+    ''' Write the queued frames to rotating chunk files
+
+    The acquisition only puts frames in the queue: the files are
+    created, filled and closed by this thread.
+    '''
+    def __init__(self, dirname, prefix, frame_shape, frame_dtype, chunk_frames, info, queue_size=256):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.dirname = dirname
+        self.prefix = prefix
+        self.frame_shape = tuple(frame_shape)
+        self.frame_dtype = np.dtype(frame_dtype)
+        self.chunk_frames = chunk_frames
+        self.info = info
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.chunks = []
+        self.data = None
+        self.times = None
+        self.n_written = 0
+        self.max_queued = 0
+        self.error = None
+
+    def put(self, index, timestamp, frame):
+        ''' Queue a frame without blocking. Returns False if the queue is full (frame dropped). '''
+        try:
+            self.queue.put_nowait((index, timestamp, frame))
+        except queue.Full:
+            return False
+        self.max_queued = max(self.max_queued, self.queue.qsize())
+        return True
+
+    def close(self):
+        ''' Write the remaining frames '''
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def path(self, filename):
+        return os.path.join(self.dirname, filename)
+
+    def open_chunk(self):
+        n = len(self.chunks)
+        chunk = {
+          'data': '{}_{:05d}.npy'.format(self.prefix, n),
+          'time': '{}_{:05d}_time.npy'.format(self.prefix, n),
+          'frames': 0
+        }
+        self.data = np.lib.format.open_memmap(self.path(chunk['data']), mode='w+', dtype=self.frame_dtype,
+                                              shape=(self.chunk_frames,) + self.frame_shape)
+        self.times = np.lib.format.open_memmap(self.path(chunk['time']), mode='w+', dtype=time_dtype,
+                                               shape=(self.chunk_frames,))
+        self.chunks.append(chunk)
+
+    def close_chunk(self):
+        chunk = self.chunks[-1]
+        self.data.flush()
+        self.times.flush()
+        arrays = {'data': self.data, 'time': self.times}
+        self.data = None
+        self.times = None
+        if chunk['frames'] < self.chunk_frames:
+            # Last chunk: truncate to the frames received
+            for key in arrays:
+                array = np.array(arrays[key][:chunk['frames']])
+                arrays[key] = None # Close the memory map before replacing the file
+                np.save(self.path(chunk[key] + '.tmp.npy'), array)
+                os.rename(self.path(chunk[key] + '.tmp.npy'), self.path(chunk[key]))
+        self.write_index()
+
+    def write_index(self, stats=None):
+        index = dict(self.info)
+        index.update({
+          'frame_shape': list(self.frame_shape),
+          'dtype': self.frame_dtype.str,
+          'chunk_frames': self.chunk_frames,
+          'chunks': self.chunks
+        })
+        if stats is not None:
+            index['stats'] = stats
+        filename = self.path(self.prefix + '.json')
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(index, f, indent=2)
+        os.rename(filename + '.tmp', filename)
+
+    def run(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                index, timestamp, frame = item
+                if self.data is None:
+                    self.open_chunk()
+                chunk = self.chunks[-1]
+                self.data[chunk['frames']] = frame
+                self.times[chunk['frames']] = (index, timestamp)
+                chunk['frames'] += 1
+                self.n_written += 1
+                if chunk['frames'] == self.chunk_frames:
+                    self.close_chunk()
+            if self.data is not None:
+                self.close_chunk()
+        except Exception as e:
+            self.error = e
+            # Keep draining the queue so that the acquisition is never blocked
+            while self.queue.get() is not None:
+                pass
+
+def record(client, device_name, command_name, args=(), dirname='.', prefix=None,
+           rate=0, n_frames=None, duration=None, chunk_frames=1000, queue_size=256, depth=4, stop_event=None):
+    ''' Record the frames returned by device_name::command_name
+
+    Args:
+        rate: Target number of frames per second (0: as fast as possible, with depth commands in flight)
+        n_frames: Number of frames (None: until duration, stop_event or Ctrl-C)
+        duration: Duration of the recording in seconds (None: no limit)
+        queue_size: Number of frames waiting to be written before frames are dropped
+
+    At a fixed rate, a frame is late when it is received after the end of
+    its period. The periods that ended before a command could be sent are
+    missed (the frame is not requested). Frames are dropped when the disk
+    does not keep up with the acquisition.
+    Returns the statistics of the recording (dict).
+    '''
+    device_id = client.get_ids(device_name, command_name)[0]
+    ret_type = strip_ret_type(client.cmds_ret_types_list[device_id][command_name])
+    if not (is_std_array(ret_type) or is_std_vector(ret_type)):
+        raise ValueError('{}::{} returns a {}, not an array or a vector.'.format(device_name, command_name, ret_type))
+
+    cmd, decoder = client.prepare(device_name, command_name, *args)
+    prefix = prefix or '{}.{}'.format(device_name, command_name)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    # First frame: shape and type of the frames
+    client.send_raw(cmd)
+    frame = decoder()
+
+    info = {
+      'command': '{}.{}'.format(device_name, command_name),
+      'args': [arg.tolist() if isinstance(arg, np.ndarray) else arg for arg in args],
+      'rate': rate
+    }
+    writer = ChunkWriter(dirname, prefix, frame.shape, frame.dtype, chunk_frames, info, queue_size)
+    writer.start()
+
+    period = 1.0 / rate if rate > 0 else 0
+    depth = 1 if rate > 0 else max(1, depth)
+    stats = {'frames': 0, 'late': 0, 'missed': 0, 'dropped': 0}
+    index = 0         # Number of the next frame (periods elapsed at a fixed rate)
+    n_sent = 0
+    sent_times = []   # Schedule of the frames in flight
+
+    def done():
+        return ((n_frames is not None and n_sent >= n_frames) or
+                (duration is not None and max(clock(), start + index * period) - start >= duration) or
+                (stop_event is not None and stop_event.is_set()))
+
+    start = clock()
+    try:
+        while True:
+            while len(sent_times) < depth and not done():
+                if period:
+                    slot = start + index * period
+                    now = clock()
+                    if now < slot:
+                        time.sleep(slot - now)
+                    elif now >= slot + period:
+                        missed = int((now - slot) / period)
+                        stats['missed'] += missed
+                        index += missed
+                        slot += missed * period
+                else:
+                    slot = clock()
+                client.send_raw(cmd)
+                sent_times.append((index, slot))
+                index += 1
+                n_sent += 1
+
+            if not sent_times:
+                break
+
+            frame = decoder()
+            timestamp = time.time()
+            frame_index, slot = sent_times.pop(0)
+            if frame.shape != writer.frame_shape:
+                raise ValueError('Frame {} has shape {} instead of {}'.format(frame_index, frame.shape, writer.frame_shape))
+            if period and clock() > slot + period:
+                stats['late'] += 1
+            if not writer.put(frame_index, timestamp, frame):
+                stats['dropped'] += 1
+            stats['frames'] += 1
+    except KeyboardInterrupt:
+        # Keep the socket in sync: receive the frames in flight
+        for _ in sent_times:
+            decoder()
+    finally:
+        elapsed = clock() - start
+        writer.close()
+        stats.update({
+          'seconds': elapsed,
+          'frames_per_second': stats['frames'] / elapsed if elapsed > 0 else 0,
+          'bytes_per_second': stats['frames'] * frame.nbytes / elapsed if elapsed > 0 else 0,
+          'written': writer.n_written,
+          'max_queued': writer.max_queued
+        })
+        writer.write_index(stats)
+
+    stats['index'] = os.path.join(dirname, prefix + '.json')
+    return stats
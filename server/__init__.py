@@ -2,23 +2,82 @@
 
 import os
 import re
+import hashlib
 import CppHeaderParser
 import jinja2
+import itertools
 import json
+import keyword
 import sys
+import tempfile
 import yaml
 
 SDK_PATH = os.getenv('SDK_PATH', '')
 
+# -----------------------------------------------------------------------------------------
+# Generated files
+# -----------------------------------------------------------------------------------------
+
+# Files updated by the process
+updated_files = []
+
+def file_digest(filename):
+    ''' SHA-256 digest of the content of a file '''
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            sha.update(chunk)
+    return sha.digest()
+
+def write_if_changed(filename, content, report=True):
+    ''' Write content to filename unless the file already contains it.
+
+    Unchanged files keep their modification time, so make does not rebuild
+    their dependents. The file is replaced atomically: a build interrupted
+    while writing never leaves a truncated file.
+    Updated files are listed in updated_files if report is True.
+    Returns True if the file has been updated.
+    '''
+    data = content.encode('utf-8')
+
+    # Compare the sizes first, then the content hashes
+    if os.path.isfile(filename) and os.path.getsize(filename) == len(data):
+        if file_digest(filename) == hashlib.sha256(data).digest():
+            return False
+
+    dirname, basename = os.path.split(filename)
+    fd, tmp_filename = tempfile.mkstemp(prefix='.' + basename + '.', dir=dirname or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_filename, 0o666 & ~umask)
+        os.rename(tmp_filename, filename)
+    except Exception:
+        os.remove(tmp_filename)
+        raise
+
+    if report:
+        updated_files.append(filename)
+    return True
+
 # -----------------------------------------------------------------------------------------
 # Code generation
 # -----------------------------------------------------------------------------------------
 
+# Drivers already parsed by the process (make.py --batch renders
+# several templates from the same headers)
+drivers_cache = {}
+
 def get_driver(path, driver_id=0):
-    driver = Driver(path)
-    driver.id = driver_id
-    driver.calls = cmd_calls(driver.raw, driver_id)
-    return driver
+    key = (os.path.abspath(path), driver_id)
+    if key not in drivers_cache:
+        driver = Driver(path)
+        driver.id = driver_id
+        driver.calls = cmd_calls(driver.raw, driver_id)
+        drivers_cache[key] = driver
+    return drivers_cache[key]
 
 def get_driver_id(drivers_list, driver_path):
     drivers_ids ={}
@@ -50,6 +109,7 @@ class Driver:
         self.header_path = os.path.dirname(path)
         self.path = path
         self.operations = dev['operations']
+        self.stream_operations = [op for op in self.operations if op['stream']]
         self.tag = dev['tag']
         self.name = dev['name']
         self.class_name = 'InTerface' + self.tag.capitalize()
@@ -64,8 +124,10 @@ def get_json(drivers):
         'class': 'KServer',
         'id': 1,
         'functions': [
-            {'name': 'get_version', 'id': 0, 'args': [], 'ret_type': 'const char *'},
-            {'name': 'get_cmds', 'id': 1, 'args': [], 'ret_type': 'std::string'}
+            {'name': 'get_version', 'id': 0, 'args': [], 'ret_type': 'const char *', 'req_size': 0, 'ret_size': None},
+            {'name': 'get_cmds', 'id': 1, 'args': [], 'ret_type': 'std::string', 'req_size': 0, 'ret_size': None}
+            # KServer::batch (id 2) is not listed: its response (n_executed, length and
+            # the responses of the commands) has no C++ return type (see KoheronClient.execute_batch)
         ]
     }]
 
@@ -73,13 +135,25 @@ def get_json(drivers):
         data.append({
             'class': driver.name,
             'id': driver.id,
-            'functions': [
-                {'name': op['name'], 'id': op['id'], 'ret_type': format_ret_type(driver.name, op),'args': op.get('args_client',[])}
-                for op in driver.operations
-            ]
+            'functions': [get_json_function(driver, op) for op in driver.operations]
         })
 
-    return json.dumps(data, separators=(',', ':')).replace('"', '\\"').replace('\\\\','')
+    # The sizes computed by the compiler are written as numbers (see format_size)
+    data_json = re.sub('"' + CPP_SIZE + '([^"]*)"', r'\\" << get_size_str(\1) << \\"', json.dumps(data, separators=(',', ':')))
+    return data_json.replace('"', '\\"').replace('\\\\','')
+
+def get_json_function(driver, operation):
+    function = {
+        'name': operation['name'],
+        'id': operation['id'],
+        'ret_type': format_ret_type(driver.name, operation),
+        'args': operation.get('args_client',[]),
+        'req_size': format_req_size(operation),
+        'ret_size': format_size('koheron::response_size_v<{}>'.format(get_exact_ret_type(driver.name, operation)))
+    }
+    if operation['stream']:
+        function['stream'] = True
+    return function
 
 def get_template(filename):
     renderer = jinja2.Environment(
@@ -93,25 +167,34 @@ def get_template(filename):
     def get_fragment(operation, driver):
         return driver.calls[operation['tag']]
 
+    def get_stream_fragment(operation, driver):
+        return generate_stream_call(driver.raw, driver.id, operation)
+
     def get_parser(operation, driver):
         return parser_generator(driver, operation)
 
     renderer.filters['get_fragment'] = get_fragment
     renderer.filters['get_parser'] = get_parser
+    renderer.filters['get_stream_fragment'] = get_stream_fragment
     renderer.filters['get_exact_ret_type'] = get_exact_ret_type
+    renderer.filters['get_py_args'] = python_args
+    renderer.filters['get_py_attributes'] = lambda operation, driver: build_python_call(driver, operation)['attributes']
+    renderer.filters['get_py_init'] = lambda operation, driver: build_python_call(driver, operation)['init']
+    renderer.filters['get_py_body'] = lambda operation, driver: build_python_call(driver, operation)['body']
+    renderer.filters['get_py_stream'] = lambda operation, driver: build_python_call(driver, operation)['stream']
 
     return renderer.get_template(filename)
 
 def render_template(template_filename, output_filename, drivers):
-    with open(output_filename, 'w') as output:
-        output.write(get_template(os.path.basename(template_filename)).render(drivers=drivers, json=get_json(drivers)))
+    template = get_template(os.path.basename(template_filename))
+    write_if_changed(output_filename, template.render(drivers=drivers, json=get_json(drivers)))
 
 def render_driver(driver, output_filename):
     output_filename_split = os.path.splitext(output_filename)
     assert(output_filename_split[1] in ['.hpp', '.cpp'])
     for extension in ['.cpp', '.hpp']:
-        with open(output_filename_split[0] + extension, 'w') as output:
-            output.write(get_template('interface_driver' + extension).render(driver=driver))
+        template = get_template('interface_driver' + extension)
+        write_if_changed(output_filename_split[0] + extension, template.render(driver=driver))
 
 # -----------------------------------------------------------------------------
 # Parse driver C++ header
@@ -149,9 +232,13 @@ def parse_header_operation(driver_name, method):
     operation['tag'] = method['name'].upper()
     operation['name'] = method['name']
     operation['ret_type'] = method['rtnType']
+    operation['stream'] = is_stream_source(method)
 
     check_type(operation['ret_type'], driver_name, operation['name'])
 
+    if operation['stream'] and operation['ret_type'] == 'void':
+        raise ValueError('[{}::{}] A stream source must return the frame to push.'.format(driver_name, operation['name']))
+
     if len(method['parameters']) > 0:
         operation['arguments'] = [] # Use for code generation
         operation['args_client'] = [] # Send to client
@@ -172,6 +259,15 @@ def parse_header_operation(driver_name, method):
             operation['args_client'].append({'name': arg['name'], 'type': format_type(arg['type'])})
     return operation
 
+# A method annotated with "/// @stream" in the driver header is a stream source:
+# when a client subscribes to it, the server calls it repeatedly and pushes each
+# returned frame. The method must block until a new frame is ready.
+STREAM_ANNOTATION = '@stream'
+
+def is_stream_source(method):
+    doxygen = method.get('doxygen') or ''
+    return any(line.strip('/* \t') == STREAM_ANNOTATION for line in doxygen.splitlines())
+
 # The following integers are forbiden since they are plateform
 # dependent and thus not compatible with network use.
 FORBIDDEN_INTS = ['short', 'int', 'unsigned', 'long', 'unsigned short', 'short unsigned',
@@ -198,6 +294,21 @@ def get_exact_ret_type(classname, operation):
     else:
         return operation['ret_type']
 
+# Request and response payload sizes of the fixed size operations
+# (null if dynamic). They are evaluated by the compiler.
+CPP_SIZE = '@size:'
+
+def format_size(expression):
+    return CPP_SIZE + expression
+
+def format_req_size(operation):
+    args = operation.get('arguments', [])
+    if any(is_std_vector(arg['type']) or is_std_string(arg['type']) for arg in args):
+        return None
+    if len(args) == 0:
+        return 0
+    return format_size(' + '.join('koheron::' + get_size_of(arg) for arg in args))
+
 def format_ret_type(classname, operation):
     if 'auto' in operation['ret_type'] or is_std_array(operation['ret_type']):
         return '" << get_type_str<{}>() << "'.format(get_exact_ret_type(classname, operation))
@@ -215,12 +326,13 @@ def cmd_calls(driver, driver_id):
         calls[op['tag']] = generate_call(driver, driver_id, op)
     return calls
 
-def generate_call(driver, driver_id, operation):
-    def build_func_call(driver, operation):
-        call = driver['objects'][0]['name'] + '.' + operation['name'] + '('
-        call += ', '.join('args_' + operation['name'] + '.' + arg['name'] for arg in operation.get('arguments', []))
-        return call + ')'
+def build_func_call(driver, operation, args_name=None):
+    args_name = args_name or 'args_' + operation['name']
+    call = driver['objects'][0]['name'] + '.' + operation['name'] + '('
+    call += ', '.join(args_name + '.' + arg['name'] for arg in operation.get('arguments', []))
+    return call + ')'
 
+def generate_call(driver, driver_id, operation):
     lines = []
     if operation['ret_type'] == 'void':
         lines.append('    {};\n'.format(build_func_call(driver, operation)))
@@ -229,6 +341,23 @@ def generate_call(driver, driver_id, operation):
         lines.append('    return cmd.session->send<{}, {}>({});\n'.format(driver_id, operation['id'], build_func_call(driver, operation)))
     return ''.join(lines)
 
+def generate_stream_call(driver, driver_id, operation):
+    ''' Push cmd.stream_frames frames. The driver is unlocked between two frames. '''
+    lines = []
+    lines.append('    for (uint32_t frame = 0; frame < cmd.stream_frames; frame++) {\n')
+    lines.append('        if (cmd.session->exit_signal) {\n')
+    lines.append('            break;\n')
+    lines.append('        }\n\n')
+    lines.append('        lock.lock();\n')
+    lines.append('        const int err = cmd.session->send<{}, {}>({});\n'.format(driver_id, operation['id'], build_func_call(driver, operation, 'args')))
+    lines.append('        lock.unlock();\n\n')
+    lines.append('        if (err <= 0) {\n')
+    lines.append('            return -1;\n')
+    lines.append('        }\n')
+    lines.append('    }\n\n')
+    lines.append('    return 0;\n')
+    return ''.join(lines)
+
 # -----------------------------------------------------------
 # Parse command arguments
 # -----------------------------------------------------------
@@ -239,25 +368,31 @@ def parser_generator(driver, operation):
         return ''
 
     lines = []
-    packs, has_vector = build_args_packs(lines, operation)
-
-    if not has_vector:
-        print_required_buff_size(lines, packs)
-        lines.append('    static_assert(req_buff_size <= cmd.payload.size(), "Buffer size too small");\n\n');
+    packs = build_args_packs(lines, operation)
 
     for idx, pack in enumerate(packs):
-        if pack['family'] == 'scalar':
-            lines.append('\n    auto args_tuple' + str(idx)  + ' = cmd.session->deserialize<')
-            print_type_list_pack(lines, pack)
-            lines.append('>(cmd);\n')
-            lines.append('    if (std::get<0>(args_tuple' + str(idx)  + ') < 0) {\n')
+        if pack['family'] == 'fixed':
+            # Scalars and arrays with a fixed layout are loaded in one block
+            req_buff_size = 'req_buff_size' + str(idx)
+            buff = 'buff' + str(idx)
+            print_required_buff_size(lines, pack, req_buff_size)
+            lines.append('    static_assert(' + req_buff_size + ' <= cmd.payload.size(), "Buffer size too small");\n\n')
+            lines.append('    const char *' + buff + ' = cmd.session->load_buffer<' + req_buff_size + '>(cmd);\n')
+            lines.append('    if (' + buff + ' == nullptr) {\n')
             lines.append('        return -1;\n')
             lines.append('    }\n')
 
-            for i, arg in enumerate(pack['args']):
-                lines.append('    args_' + operation['name'] + '.' + arg["name"] + ' = ' + 'std::get<' + str(i + 1) + '>(args_tuple' + str(idx) + ');\n');
-
-        elif pack['family'] in ['vector', 'string', 'array']:
+            offset = []
+            for arg in pack['args']:
+                position = buff + ''.join(' + ' + size for size in offset)
+                if is_std_array(arg['type']):
+                    lines.append('    std::memcpy(args_' + operation['name'] + '.' + arg['name'] + '.data(), ' + position + ', ' + get_size_of(arg) + ');\n')
+                else:
+                    lines.append('    args_' + operation['name'] + '.' + arg['name'] + ' = extract<' + arg['type'] + '>(' + position + ');\n')
+                offset.append(get_size_of(arg))
+            lines.append('\n')
+
+        elif pack['family'] in ['vector', 'string']:
             lines.append('    if (cmd.session->recv(args_' + operation['name'] + '.' + pack['args']['name'] + ', cmd) < 0) {\n')
             lines.append('        return -1;\n')
             lines.append('    }\n\n')
@@ -265,55 +400,26 @@ def parser_generator(driver, operation):
             raise ValueError('Unknown argument family')
     return ''.join(lines)
 
-def print_required_buff_size(lines, packs):
-    lines.append('    constexpr size_t req_buff_size = ')
+def get_size_of(arg):
+    if is_std_array(arg['type']):
+        array_params = get_std_array_params(arg['type'])
+        return 'size_of<' + array_params['T'] + ', ' + array_params['N'] + '>'
+    return 'size_of<' + arg['type'] + '>'
 
-    for idx, pack in enumerate(packs):
-        if pack['family'] == 'scalar':
-            if idx == 0:
-                lines.append('required_buffer_size<')
-            else:
-                lines.append('                                     + required_buffer_size<')
-            print_type_list_pack(lines, pack)
-            if idx < len(packs) - 1:
-                lines.append('>()\n')
-            else:
-                lines.append('>();\n')
-        elif pack['family'] == 'array':
-            array_params = get_std_array_params(pack['args']['type'])
-            if idx == 0:
-                lines.append('size_of<')
-            else:
-                lines.append('                                     + size_of<')
-            lines.append(array_params['T'] + ', ' + array_params['N'] + '>')
-            if idx < len(packs) - 1:
-                lines.append('\n')
-            else:
-                lines.append(';\n')
-
-def print_type_list_pack(lines, pack):
-    for idx, arg in enumerate(pack['args']):
-        if idx < len(pack['args']) - 1:
-            lines.append(arg['type'] + ', ')
-        else:
-            lines.append(arg['type'])
+def print_required_buff_size(lines, pack, req_buff_size):
+    lines.append('    constexpr size_t ' + req_buff_size + ' = ')
+    lines.append('\n                                     + '.join(get_size_of(arg) for arg in pack['args']))
+    lines.append(';\n')
 
 def build_args_packs(lines, operation):
-    ''' Packs the adjacent scalars together for deserialization
-        and separate them from the arrays and vectors '''
+    ''' Packs the adjacent scalars and arrays together for deserialization
+        in a single fixed size block and separate them from the vectors and strings '''
     packs = []
     args_list = []
-    has_vector = False
     for idx, arg in enumerate(operation["arguments"]):
-        if is_std_array(arg['type']):
-            if len(args_list) > 0:
-                packs.append({'family': 'scalar', 'args': args_list})
-                args_list = []
-            packs.append({'family': 'array', 'args': arg})
-        elif is_std_vector(arg['type']) or is_std_string(arg['type']):
-            has_vector = True
+        if is_std_vector(arg['type']) or is_std_string(arg['type']):
             if len(args_list) > 0:
-                packs.append({'family': 'scalar', 'args': args_list})
+                packs.append({'family': 'fixed', 'args': args_list})
                 args_list = []
             if is_std_vector(arg['type']):
                 packs.append({'family': 'vector', 'args': arg})
@@ -324,8 +430,8 @@ def build_args_packs(lines, operation):
         else:
             args_list.append(arg)
     if len(args_list) > 0:
-        packs.append({'family': 'scalar', 'args': args_list})
-    return packs, has_vector
+        packs.append({'family': 'fixed', 'args': args_list})
+    return packs
 
 def is_std_array(arg_type):
     container_type = arg_type.split('<')[0].strip()
@@ -344,3 +450,148 @@ def get_std_array_params(arg_type):
       'T': templates[0].strip(),
       'N': templates[1].strip()
     }
+
+def get_std_vector_params(arg_type):
+    return {'T': arg_type.split('<')[1].split('>')[0].split(',')[0].strip()}
+
+# -----------------------------------------------------------
+# Generate Python driver module
+# -----------------------------------------------------------
+
+# struct format characters of the exact width scalars
+STRUCT_FORMATS = {
+    'bool': '?',
+    'uint8_t': 'B', 'int8_t': 'b',
+    'uint16_t': 'H', 'int16_t': 'h',
+    'uint32_t': 'I', 'int32_t': 'i',
+    'uint64_t': 'Q', 'int64_t': 'q',
+    'unsigned long long': 'Q', 'long long': 'q',
+    'float': 'f',
+    'double': 'd'
+}
+
+NUMPY_DTYPES = {
+    'bool': 'bool',
+    'uint8_t': 'uint8', 'int8_t': 'int8',
+    'uint16_t': 'uint16', 'int16_t': 'int16',
+    'uint32_t': 'uint32', 'int32_t': 'int32',
+    'uint64_t': 'uint64', 'int64_t': 'int64',
+    'unsigned long long': 'uint64', 'long long': 'int64',
+    'float': 'float32',
+    'double': 'float64'
+}
+
+def python_name(name):
+    return name + '_' if keyword.iskeyword(name) else name
+
+def python_args(operation):
+    return ''.join(', ' + python_name(arg['name']) for arg in operation.get('arguments', []))
+
+def get_struct_format(_type, driver_name, opname):
+    if _type not in STRUCT_FORMATS:
+        raise ValueError('[{}::{}] Type "{}" is not supported by the Python driver module.'.format(driver_name, opname, _type))
+    return STRUCT_FORMATS[_type]
+
+def get_numpy_dtype(_type, driver_name, opname):
+    if _type not in NUMPY_DTYPES:
+        raise ValueError('[{}::{}] Array type "{}" is not supported by the Python driver module.'.format(driver_name, opname, _type))
+    return NUMPY_DTYPES[_type]
+
+def strip_ret_type(ret_type):
+    ret_type = ret_type.split('&')[0].strip()
+    if ret_type.startswith('const '):
+        ret_type = ret_type[len('const '):].strip()
+    return ret_type
+
+def is_literal_size(size):
+    return size.rstrip('uU').isdigit()
+
+def build_python_call(driver, operation):
+    ''' Generate the Python call of an operation.
+
+        Returns the class attributes (precompiled structs), the lines
+        to add in __init__ (sizes only known by the server), the body
+        of the method and the body of the stream iterator for the stream
+        sources. '''
+    name = operation['name']
+    attributes = []
+    init = []
+    body = []
+
+    # The command header is serialized with the first scalar arguments
+    items = [('I', '0'), ('H', str(driver.id)), ('H', str(operation['id']))]
+
+    for arg in operation.get('arguments', []):
+        if is_std_array(arg['type']):
+            params = get_std_array_params(arg['type'])
+            dtype = get_numpy_dtype(params['T'], driver.name, name)
+            if is_literal_size(params['N']):
+                length = params['N'].rstrip('uU')
+            else:
+                length = 'self._{}_{}_len'.format(name, arg['name'])
+                init.append("{} = client.get_array_length('{}', '{}', '{}')".format(length, driver.name, name, arg['name']))
+            items.append((None, "encode_array({}, '{}', {})".format(python_name(arg['name']), dtype, length)))
+        elif is_std_vector(arg['type']):
+            dtype = get_numpy_dtype(get_std_vector_params(arg['type'])['T'], driver.name, name)
+            items.append((None, "encode_vector({}, '{}')".format(python_name(arg['name']), dtype)))
+        elif is_std_string(arg['type']):
+            items.append((None, 'encode_string({})'.format(python_name(arg['name']))))
+        else:
+            items.append((get_struct_format(arg['type'], driver.name, name), python_name(arg['name'])))
+
+    # Adjacent scalars are serialized with a single precompiled struct
+    segments = []
+    for is_scalar, group in itertools.groupby(items, key=lambda item: item[0] is not None):
+        group = list(group)
+        if not is_scalar:
+            segments.extend(item[1] for item in group)
+        elif len(segments) == 0 and len(group) == 3:
+            attributes.append("_{}_header = struct.pack('>IHH', {})".format(name, ', '.join(item[1] for item in group)))
+            segments.append('self._{}_header'.format(name))
+        else:
+            attributes.append("_{}_args{} = struct.Struct('>{}')".format(name, len(segments), ''.join(item[0] for item in group)))
+            segments.append('self._{}_args{}.pack({})'.format(name, len(segments), ', '.join(item[1] for item in group)))
+
+    if len(segments) == 1:
+        command = segments[0]
+    else:
+        command = "b''.join(({}))".format(', '.join(segments))
+
+    ret_type = strip_ret_type(operation['ret_type'])
+
+    if ret_type == 'void':
+        decode = None
+    elif ret_type in STRUCT_FORMATS:
+        attributes.append("_{}_ret = struct.Struct('>IHH{}')".format(name, STRUCT_FORMATS[ret_type]))
+        decode = 'self.client.recv_struct(self._{}_ret)[0]'.format(name)
+    elif is_std_array(ret_type) and is_literal_size(get_std_array_params(ret_type)['N']):
+        params = get_std_array_params(ret_type)
+        dtype = get_numpy_dtype(params['T'], driver.name, name)
+        decode = "self.client.recv_array({}, dtype='{}', check_type=False)".format(params['N'].rstrip('uU'), dtype)
+    elif is_std_vector(ret_type):
+        dtype = get_numpy_dtype(get_std_vector_params(ret_type)['T'], driver.name, name)
+        decode = "self.client.recv_vector(dtype='{}', check_type=False)".format(dtype)
+    elif is_std_string(ret_type) or ret_type in ['char *', 'char*']:
+        decode = 'self.client.recv_string(check_type=False)'
+    elif ret_type.startswith('std::tuple<') and all(T.strip() in STRUCT_FORMATS for T in ret_type[len('std::tuple<'):-1].split(',')):
+        fmt = ''.join(STRUCT_FORMATS[T.strip()] for T in ret_type[len('std::tuple<'):-1].split(','))
+        attributes.append("_{}_ret = struct.Struct('>IHH{}')".format(name, fmt))
+        decode = 'self.client.recv_struct(self._{}_ret)'.format(name)
+    elif ret_type.startswith('std::tuple<') and '<' in ret_type[len('std::tuple<'):]:
+        # Only tuples of scalars are serialized by the server
+        raise TypeError('[{}::{}] Unsupported return type "{}"'.format(driver.name, name, operation['ret_type']))
+    else:
+        # The return type is only resolved by the compiler (auto, sizes from constants ...)
+        init.append("self._{}_ret = client.get_ret_decoder('{}', '{}')".format(name, driver.name, name))
+        decode = 'self._{}_ret()'.format(name)
+
+    body.append('self.client.send_raw({})'.format(command))
+    if decode is not None:
+        body.append('return ' + decode)
+
+    if operation['stream']:
+        stream = ['return self.client.stream_frames({}, lambda: {}, count, batch)'.format(command, decode)]
+    else:
+        stream = []
+
+    return {'attributes': attributes, 'init': init, 'body': body, 'stream': stream}
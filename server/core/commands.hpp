@@ -31,6 +31,9 @@ struct Buffer
     char* data()   {return _data.data();}
     char* begin()  {return &(_data.data())[position];}
 
+    size_t get_position() const {return position;}
+    void skip(size_t n)         {position += n;}
+
     // These functions are used by Websocket
 
     template<typename... Tp>
@@ -42,6 +45,15 @@ struct Buffer
         return tup;
     }
 
+    // Fixed size block of n bytes starting at the current position
+    template<size_t n>
+    const char* extract_block() {
+        static_assert(n <= len, "Buffer size too small");
+        const char *block = begin();
+        position += n;
+        return block;
+    }
+
     template<typename T, size_t N>
     const std::array<T, N>& extract_array() {
         // http://stackoverflow.com/questions/11205186/treat-c-cstyle-array-as-stdarray
@@ -86,13 +98,14 @@ struct Command
 
     enum Header : uint32_t {
         HEADER_SIZE = 8,
-        HEADER_START = 4  // First 4 bytes are reserved
+        HEADER_START = 4  // First 4 bytes are the number of stream frames
     };
 
     SessionID session_id = -1; // ID of the session emitting the command
     SessionAbstract *session; // Pointer to the session emitting the command
     driver_id driver = driver_id_of<NoDriver>; // The driver to control
     int32_t operation = -1; // Operation ID
+    uint32_t stream_frames = 0; // Number of frames requested to a stream source (0 for a single call)
 
     Buffer<HEADER_SIZE> header; // Raw data header
     Buffer<CMD_PAYLOAD_BUFFER_LEN> payload;
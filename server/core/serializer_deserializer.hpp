@@ -305,6 +305,45 @@ inline std::tuple<Tp...> deserialize(const char *buff) {
     return detail::deserialize<position, Tp...>(buff);
 }
 
+// ------------------------
+// Response size
+// ------------------------
+
+// Number of bytes following the header of the response
+// to a command returning T (-1 if the size is dynamic)
+
+template<typename T, typename = void>
+struct response_size : std::integral_constant<int64_t, -1> {};
+
+template<>
+struct response_size<void> : std::integral_constant<int64_t, 0> {};
+
+template<typename T>
+struct response_size<T, std::enable_if_t<std::is_arithmetic<T>::value>>
+: std::integral_constant<int64_t, size_of<T>> {};
+
+template<typename T>
+struct response_size<std::complex<T>> : std::integral_constant<int64_t, size_of<std::complex<T>>> {};
+
+template<typename T, size_t N>
+struct response_size<std::array<T, N>> : std::integral_constant<int64_t, size_of<T, N>> {};
+
+// Tuples are serialized element by element
+template<typename... Tp>
+struct response_size<std::tuple<Tp...>>
+: std::integral_constant<int64_t, ((response_size<Tp>::value < 0) || ...)
+                                  ? -1 : (int64_t(0) + ... + response_size<Tp>::value)> {};
+
+template<typename T>
+constexpr int64_t response_size_v = response_size<std::decay_t<T>>::value;
+
+static_assert(response_size_v<void> == 0, "");
+static_assert(response_size_v<const uint32_t&> == 4, "");
+static_assert(response_size_v<std::array<float, 10>> == 40, "");
+static_assert(response_size_v<std::tuple<uint32_t, double, bool>> == 13, "");
+static_assert(response_size_v<std::vector<float>> == -1, "");
+static_assert(response_size_v<std::tuple<uint32_t, std::string>> == -1, "");
+
 // ------------------------
 // Serializer
 // ------------------------
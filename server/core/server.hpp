@@ -102,6 +102,7 @@ class Server
     enum Operation {
         GET_VERSION = 0,            ///< Send th version of the server
         GET_CMDS = 1,               ///< Send the commands numbers
+        BATCH = 2,                  ///< Execute a sequence of commands
         server_op_num
     };
 
@@ -24,10 +24,41 @@ template<> int Server::execute_operation<Server::GET_CMDS>(Command& cmd)
     return session_manager.get_session(cmd.session_id).send<1, Server::GET_CMDS>(build_drivers_json());
 }
 
+// Execute the commands following the batch command
+// and send all their responses in a single message
+// | header | n_entries (u32) | length (u32) | length bytes of commands |
+template<> int Server::execute_operation<Server::BATCH>(Command& cmd)
+{
+    auto& session = session_manager.get_session(cmd.session_id);
+    const auto args = session.deserialize<uint32_t, uint32_t>(cmd);
+
+    if (std::get<0>(args) < 0) {
+        syslog.print<ERROR>("Server::BATCH: Cannot read the number of commands\n");
+        return -1;
+    }
+
+    const uint32_t n_entries = std::get<1>(args);
+    const uint32_t length = std::get<2>(args);
+    std::vector<unsigned char> responses;
+    const uint32_t n_executed = session.execute_batch(cmd, n_entries, length, responses);
+    const int err = session.send<1, Server::BATCH>(n_executed, responses);
+
+    if (n_executed < n_entries) {
+        return -1;
+    }
+
+    return err;
+}
+
 ////////////////////////////////////////////////
 
 int Server::execute(Command& cmd)
 {
+    // The batched commands are executed by the drivers, which have their own lock
+    if (cmd.operation == Server::BATCH) {
+        return execute_operation<Server::BATCH>(cmd);
+    }
+
     std::lock_guard<std::mutex> lock(this->ks_mutex);
 
     switch (cmd.operation) {
@@ -2,6 +2,9 @@
 
 #include "session.hpp"
 
+#include <cstring>
+#include <algorithm>
+
 namespace koheron {
 
 // -----------------------------------------------
@@ -15,7 +18,7 @@ template<>
 int Session<TCP>::read_command(Command& cmd)
 {
     // Read and decode header
-    // |      RESERVED     | dev_id  |  op_id  |             payload_size              |   payload
+    // |   STREAM_FRAMES   | dev_id  |  op_id  |             payload_size              |   payload
     // |  0 |  1 |  2 |  3 |  4 |  5 |  6 |  7 |  8 |  9 | 10 | 11 | 12 | 13 | 14 | 15 | 16 | 17 | ...
     const int header_bytes = rcv_n_bytes(cmd.header.data(), Command::HEADER_SIZE);
 
@@ -33,6 +36,7 @@ int Session<TCP>::read_command(Command& cmd)
     cmd.session = this;
     cmd.driver = static_cast<driver_id>(std::get<0>(header_tuple));
     cmd.operation = std::get<1>(header_tuple);
+    cmd.stream_frames = extract<uint32_t>(cmd.header.data());
 
     syslog.print<DEBUG>("TCPSocket: Receive command for driver %u, operation %u\n",
         cmd.driver, cmd.operation);
@@ -40,10 +44,57 @@ int Session<TCP>::read_command(Command& cmd)
     return header_bytes;
 }
 
+// The commands of a batch follow the batch command on the socket
+template<>
+const char* Session<TCP>::load_batch(Command&, uint32_t length)
+{
+    if (length > CMD_PAYLOAD_BUFFER_LEN) {
+        // Discard the batch to keep the socket in sync
+        syslog.print<ERROR>("TCPSocket: Batch of %u bytes too large\n", length);
+        std::array<char, 4096> discard;
+        for (uint32_t n_bytes = 0; n_bytes < length; n_bytes += discard.size()) {
+            if (rcv_n_bytes(discard.data(), std::min<int64_t>(discard.size(), length - n_bytes)) <= 0) {
+                break;
+            }
+        }
+        return nullptr;
+    }
+
+    batch_buffer.resize(length);
+
+    if (length > 0 && rcv_n_bytes(batch_buffer.data(), length) <= 0) {
+        return nullptr;
+    }
+
+    return batch_buffer.data();
+}
+
+// The driver reads the payload with rcv_n_bytes
+template<>
+int Session<TCP>::load_batch_entry(Command&, const char *payload, uint32_t payload_length)
+{
+    batch_payload = payload;
+    batch_payload_remaining = payload_length;
+    return 0;
+}
+
 // TODO Replace by function load_buffer
 template<>
 int64_t Session<TCP>::rcv_n_bytes(char *buffer, int64_t n_bytes)
 {
+    // Command of a batch
+    if (batch_payload != nullptr) {
+        if (n_bytes > batch_payload_remaining) {
+            syslog.print<ERROR>("TCPSocket: Payload of batch command too small\n");
+            return -1;
+        }
+
+        std::memcpy(buffer, batch_payload, n_bytes);
+        batch_payload += n_bytes;
+        batch_payload_remaining -= n_bytes;
+        return n_bytes;
+    }
+
     int64_t bytes_rcv = 0;
     int64_t bytes_read = 0;
 
@@ -112,6 +163,7 @@ int Session<WEBSOCK>::read_command(Command& cmd)
     cmd.session = this;
     cmd.driver = static_cast<driver_id>(std::get<0>(header_tuple));
     cmd.operation = std::get<1>(header_tuple);
+    cmd.stream_frames = extract<uint32_t>(cmd.header.data());
 
     syslog.print<DEBUG>(
         "WebSocket: Receive command for driver %u, operation %u\n",
@@ -120,4 +172,31 @@ int Session<WEBSOCK>::read_command(Command& cmd)
     return Command::HEADER_SIZE;
 }
 
+// The commands of a batch are stored in the payload of the batch command
+template<>
+const char* Session<WEBSOCK>::load_batch(Command& batch, uint32_t length)
+{
+    const int64_t remaining = websock.payload_size() - Command::HEADER_SIZE
+                              - static_cast<int64_t>(batch.payload.get_position());
+
+    if (length > remaining) {
+        syslog.print<ERROR>("WebSocket: Batch command too small\n");
+        return nullptr;
+    }
+
+    return batch.payload.begin();
+}
+
+template<>
+int Session<WEBSOCK>::load_batch_entry(Command& cmd, const char *payload, uint32_t payload_length)
+{
+    if (payload_length > CMD_PAYLOAD_BUFFER_LEN) {
+        syslog.print<ERROR>("WebSocket: Payload size overflow in batch command\n");
+        return -1;
+    }
+
+    std::memcpy(cmd.payload.data(), payload, payload_length);
+    return 0;
+}
+
 } // namespace koheron
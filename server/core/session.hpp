@@ -11,6 +11,7 @@
 #include <unistd.h>
 #include <type_traits>
 #include <cassert>
+#include <cstring>
 
 #include "commands.hpp"
 #include "serializer_deserializer.hpp"
@@ -61,9 +62,20 @@ class Session : public SessionAbstract
     template<typename T>
     int recv(std::vector<T>& vec, Command&);
 
+    // Load a block of len bytes with a fixed layout (scalars and arrays).
+    // Returns a pointer to the block or nullptr on failure.
+    template<size_t len>
+    const char* load_buffer(Command& cmd);
+
     template<uint16_t class_id, uint16_t func_id, typename... Args>
     int send(Args&&... args) {
         dynamic_serializer.build_command<class_id, func_id>(send_buffer, std::forward<Args>(args)...);
+
+        if (batch_responses != nullptr) {
+            batch_responses->insert(batch_responses->end(), send_buffer.begin(), send_buffer.end());
+            return send_buffer.size();
+        }
+
         const auto bytes_send = write(send_buffer.data(), send_buffer.size());
 
         if (bytes_send == 0) {
@@ -73,6 +85,12 @@ class Session : public SessionAbstract
         return bytes_send;
     }
 
+    // Execute the n_entries commands stored in the length bytes following the batch command.
+    // Their responses are appended to responses instead of being sent.
+    // Returns the number of commands successfully executed.
+    uint32_t execute_batch(Command& batch, uint32_t n_entries, uint32_t length,
+                           std::vector<unsigned char>& responses);
+
   private:
     int comm_fd;  ///< Socket file descriptor
     SessionID id;
@@ -92,6 +110,15 @@ class Session : public SessionAbstract
     std::vector<unsigned char> send_buffer;
     DynamicSerializer<1024> dynamic_serializer;
 
+    // Responses of the batch being executed (nullptr outside of a batch)
+    std::vector<unsigned char> *batch_responses = nullptr;
+
+    // TCP: commands of the batch being executed, and payload
+    // of the current command (nullptr outside of a batch)
+    std::vector<char> batch_buffer;
+    const char *batch_payload = nullptr;
+    int64_t batch_payload_remaining = 0;
+
     enum {CLOSED, OPENED};
     int status;
 
@@ -111,6 +138,11 @@ class Session : public SessionAbstract
 
     int read_command(Command& cmd);
 
+    // Load the length bytes of commands of a batch (nullptr on failure)
+    const char* load_batch(Command& batch, uint32_t length);
+    // Make the payload of a batch command available to its driver
+    int load_batch_entry(Command& cmd, const char *payload, uint32_t payload_length);
+
     int64_t get_pack_length() {
         Buffer<sizeof(uint64_t)> buff;
         const auto err = rcv_n_bytes(buff.data(), sizeof(uint32_t));
@@ -173,6 +205,76 @@ int Session<socket_type>::run()
     return 0;
 }
 
+template<int socket_type>
+uint32_t Session<socket_type>::execute_batch(Command& batch, uint32_t n_entries, uint32_t length,
+                                             std::vector<unsigned char>& responses)
+{
+    responses.clear();
+
+    // The whole batch is loaded before the first command is executed,
+    // so that the commands not executed never remain on the socket.
+    const char *entries = load_batch(batch, length);
+
+    if (entries == nullptr) {
+        syslog.print<ERROR>("Batch: Cannot load %u bytes of commands\n", length);
+        return 0;
+    }
+
+    batch_responses = &responses;
+    uint32_t position = 0;
+    uint32_t n_executed = 0;
+
+    for (; n_executed < n_entries; n_executed++) {
+        // Entry: | header | payload_length (u32) | payload |
+        if (length - position < Command::HEADER_SIZE + sizeof(uint32_t)) {
+            syslog.print<ERROR>("Batch: Command %u is truncated\n", n_executed);
+            break;
+        }
+
+        Command cmd;
+        std::memcpy(cmd.header.data(), entries + position, Command::HEADER_SIZE);
+        const uint32_t payload_length = extract<uint32_t>(entries + position + Command::HEADER_SIZE);
+        position += Command::HEADER_SIZE + sizeof(uint32_t);
+
+        if (payload_length > length - position) {
+            syslog.print<ERROR>("Batch: Payload of command %u is truncated\n", n_executed);
+            break;
+        }
+
+        const auto header_tuple = cmd.header.deserialize<uint16_t, uint16_t>();
+        cmd.session_id = id;
+        cmd.session = this;
+        cmd.driver = static_cast<driver_id>(std::get<0>(header_tuple));
+        cmd.operation = std::get<1>(header_tuple);
+        cmd.stream_frames = extract<uint32_t>(cmd.header.data());
+
+        // Server commands and stream subscriptions cannot be nested in a batch
+        if (cmd.driver >= device_num || cmd.driver == 1 || cmd.stream_frames > 0) {
+            syslog.print<ERROR>("Batch: Invalid command %u [driver = %i, operation = %i]\n",
+                                n_executed, cmd.driver, cmd.operation);
+            break;
+        }
+
+        if (load_batch_entry(cmd, entries + position, payload_length) < 0) {
+            break;
+        }
+
+        position += payload_length;
+        const int err = driver_manager.execute(cmd);
+        batch_payload = nullptr;
+
+        if (err < 0) {
+            syslog.print<ERROR>("Batch: Failed to execute command %u [driver = %i, operation = %i]\n",
+                                n_executed, cmd.driver, cmd.operation);
+            break;
+        }
+    }
+
+    batch_payload = nullptr;
+    batch_responses = nullptr;
+    return n_executed;
+}
+
 // -----------------------------------------------
 // TCP
 // -----------------------------------------------
@@ -227,6 +329,17 @@ inline int Session<TCP>::recv(std::string& str, Command&)
     return err;
 }
 
+template<>
+template<size_t len>
+inline const char* Session<TCP>::load_buffer(Command& cmd)
+{
+    if (rcv_n_bytes(cmd.payload.data(), len) <= 0) {
+        return nullptr;
+    }
+
+    return cmd.payload.data();
+}
+
 template<>
 template<typename... Tp>
 inline std::tuple<int, Tp...> Session<TCP>::deserialize(Command&, std::false_type)
@@ -325,6 +438,13 @@ inline int Session<WEBSOCK>::recv(std::string& str, Command& cmd)
     return 0;
 }
 
+template<>
+template<size_t len>
+inline const char* Session<WEBSOCK>::load_buffer(Command& cmd)
+{
+    return cmd.payload.extract_block<len>();
+}
+
 template<>
 template<typename... Tp>
 inline std::tuple<int, Tp...> Session<WEBSOCK>::deserialize(Command& cmd, std::false_type)
@@ -384,6 +504,36 @@ inline int SessionAbstract::recv(Tp& container, Command& cmd)
     }
 }
 
+template<size_t len>
+inline const char* SessionAbstract::load_buffer(Command& cmd)
+{
+    switch (this->type) {
+        case TCP:
+            return static_cast<Session<TCP>*>(this)->template load_buffer<len>(cmd);
+        case UNIX:
+            return static_cast<Session<UNIX>*>(this)->template load_buffer<len>(cmd);
+        case WEBSOCK:
+            return static_cast<Session<WEBSOCK>*>(this)->template load_buffer<len>(cmd);
+        default:
+            return nullptr;
+    }
+}
+
+inline uint32_t SessionAbstract::execute_batch(Command& batch, uint32_t n_entries, uint32_t length,
+                                               std::vector<unsigned char>& responses)
+{
+    switch (this->type) {
+        case TCP:
+            return static_cast<Session<TCP>*>(this)->execute_batch(batch, n_entries, length, responses);
+        case UNIX:
+            return static_cast<Session<UNIX>*>(this)->execute_batch(batch, n_entries, length, responses);
+        case WEBSOCK:
+            return static_cast<Session<WEBSOCK>*>(this)->execute_batch(batch, n_entries, length, responses);
+        default:
+            return 0;
+    }
+}
+
 template<uint16_t class_id, uint16_t func_id, typename... Args>
 inline int SessionAbstract::send(Args&&... args)
 {
@@ -19,7 +19,9 @@ class SessionAbstract
 
     template<typename... Tp> std::tuple<int, Tp...> deserialize(Command& cmd);
     template<typename Tp> int recv(Tp& container, Command& cmd);
+    template<size_t len> const char* load_buffer(Command& cmd);
     template<uint16_t class_id, uint16_t func_id, typename... Args> int send(Args&&... args);
+    uint32_t execute_batch(Command& batch, uint32_t n_entries, uint32_t length, std::vector<unsigned char>& responses);
 
     int type;
 
@@ -38,6 +38,15 @@ class Common
         //ip_on_leds();
     };
 
+    // Snapshots of all the registers (decoded by memory.py)
+    const std::array<uint32_t, reg::n_control>& get_control_registers() {
+        return ctl.read_reg_array<uint32_t, reg::n_control>(0);
+    }
+
+    const std::array<uint32_t, reg::n_status>& get_status_registers() {
+        return sts.read_reg_array<uint32_t, reg::n_status>(0);
+    }
+
     std::string get_instrument_config() {
         return CFG_JSON;
     }
@@ -7,7 +7,7 @@ $(TMP_SERVER_PATH):
 SERVER_TEMPLATES := $(wildcard $(SERVER_PATH)/templates/*.hpp $(SERVER_PATH)/templates/*.cpp)
 SERVER_OBJ := $(subst .cpp,.o, $(addprefix $(TMP_SERVER_PATH)/, $(notdir $(wildcard $(SERVER_PATH)/core/*.cpp))))
 
-DRIVERS := $(shell $(MAKE_PY) --drivers $(CONFIG) $(TMP_SERVER_PATH)/drivers && cat $(TMP_SERVER_PATH)/drivers)
+DRIVERS := $(shell cat $(TMP_SERVER_PATH)/drivers 2> /dev/null)
 DRIVERS_HPP := $(filter %.hpp,$(DRIVERS))
 DRIVERS_CPP := $(filter %.cpp,$(DRIVERS))
 DRIVERS_OBJ := $(addprefix $(TMP_SERVER_PATH)/, $(subst .cpp,.o,$(notdir $(filter %.cpp,$(DRIVERS)))))
@@ -18,29 +18,47 @@ INTERFACE_DRIVERS_HPP := $(addprefix $(TMP_SERVER_PATH)/interface_,$(notdir $(DR
 INTERFACE_DRIVERS_CPP := $(subst .hpp,.cpp,$(INTERFACE_DRIVERS_HPP))
 INTERFACE_DRIVERS_OBJ := $(subst .hpp,.o,$(INTERFACE_DRIVERS_HPP))
 
-# Render driver interfaces from templates
+# Render the templates (driver interfaces and other sources)
+# in a single make.py process
 ###############################################################################
 
-define render_interface
-$(TMP_SERVER_PATH)/interface_$(notdir $1) $(TMP_SERVER_PATH)/interface_$(subst .hpp,.cpp,$(notdir $1)): \
-		$1 $(SERVER_PATH)/templates/interface_driver.hpp $(SERVER_PATH)/templates/interface_driver.cpp | $(TMP_SERVER_PATH)
-	$(MAKE_PY) --render_interface $(CONFIG) $$@ $1
-endef
-$(foreach driver,$(DRIVERS_HPP),$(eval $(call render_interface,$(driver))))
+SERVER_TEMPLATE_LIST := $(addprefix $(TMP_SERVER_PATH)/, drivers_table.hpp drivers_json.hpp context.cpp drivers.hpp interface_drivers.hpp operations.hpp)
+# The memory map of the clients (memory.py) is emitted with memory.hpp
+MEMORY_PY := $(TMP_SERVER_PATH)/memory.py
+SERVER_SOURCES := $(SERVER_TEMPLATE_LIST) $(INTERFACE_DRIVERS_HPP) $(INTERFACE_DRIVERS_CPP) $(TMP_SERVER_PATH)/memory.hpp $(MEMORY_PY)
+SERVER_MANIFEST := $(TMP_SERVER_PATH)/sources.manifest
+
+$(SERVER_MANIFEST): $(SERVER_TEMPLATES) $(SERVER_PATH)/templates/memory.py.j2 $(DRIVERS_HPP) $(MEMORY_YML) | $(TMP_SERVER_PATH)
+	@printf '%s\n' \
+		$(foreach template,$(SERVER_TEMPLATE_LIST),'--render_template $(CONFIG) $(template) $(SERVER_PATH)/templates/$(notdir $(template))') \
+		$(foreach driver,$(DRIVERS_HPP),'--render_interface $(CONFIG) $(TMP_SERVER_PATH)/interface_$(notdir $(driver)) $(driver)') \
+		'--memory_hpp $(CONFIG) $(TMP_SERVER_PATH)/memory.hpp' \
+		'--memory_py $(CONFIG) $(MEMORY_PY)' > $@
+	$(MAKE_PY) --batch $@
+
+# make.py keeps the mtime of the sources whose content did not change:
+# the manifest, written at each render, is the stamp of the sources.
+$(SERVER_SOURCES): $(SERVER_MANIFEST) ;
+
+# Render again if a source was removed
+ifneq ($(filter-out $(wildcard $(SERVER_SOURCES)),$(SERVER_SOURCES)),)
+.PHONY: $(SERVER_MANIFEST)
+endif
 
-# Render other templates
+# Files read by make.py to render the sources
+-include $(SERVER_MANIFEST).d
+
+# Python module with one class per driver (client side)
 ###############################################################################
+PYTHON_DRIVERS := $(TMP_SERVER_PATH)/drivers.py
 
-$(TMP_SERVER_PATH)/memory.hpp: $(MEMORY_YML)
-	$(MAKE_PY) --memory_hpp $(CONFIG) $@
+$(PYTHON_DRIVERS): $(SERVER_PATH)/templates/drivers.py.j2 $(DRIVERS_HPP)
+	$(MAKE_PY) --render_template $(CONFIG) $@ $<
 
-SERVER_TEMPLATE_LIST := $(addprefix $(TMP_SERVER_PATH)/, drivers_table.hpp drivers_json.hpp context.cpp drivers.hpp interface_drivers.hpp operations.hpp)
+-include $(PYTHON_DRIVERS).d
 
-define render_template
-$1: $(SERVER_PATH)/templates/$(notdir $1) $(DRIVERS_HPP)
-	$(MAKE_PY) --render_template $(CONFIG) $$@ $$<
-endef
-$(foreach template,$(SERVER_TEMPLATE_LIST),$(eval $(call render_template,$(template))))
+.PHONY: python_drivers
+python_drivers: $(PYTHON_DRIVERS) $(MEMORY_PY)
 
 # Compile the executable with GCC
 ###############################################################################
@@ -11,6 +11,8 @@
 #include <typeinfo>
 #include <cxxabi.h>
 
+#include <serializer_deserializer.hpp>
+
 {% for driver in drivers -%}
 {% for include in driver.includes -%}
 #include "{{ include }}"
@@ -37,6 +39,12 @@ inline auto get_type_str()
     return res;
 }
 
+// JSON value of a serialized size (null if the size is dynamic)
+inline std::string get_size_str(int64_t size)
+{
+    return size < 0 ? "null" : std::to_string(size);
+}
+
 inline auto build_drivers_json()
 {
     std::stringstream ss;
@@ -26,8 +26,41 @@ int Driver<driver_id_of<{{ driver.objects[0]["type"] }}>>::
 
 {% endfor %}
 
+{% for operation in driver.stream_operations -%}
+/////////////////////////////////////
+// {{ operation['name'] }} (stream)
+
+template<>
+int Driver<driver_id_of<{{ driver.objects[0]["type"] }}>>::
+        stream_operation<Driver<driver_id_of<{{ driver.objects[0]["type"] }}>>::{{ operation['tag'] }}>(Command& cmd)
+{
+    std::unique_lock<std::mutex> lock(mutex);
+    {{ operation | get_parser(driver) }}
+{%- if operation['arguments'] %}
+    const auto args = args_{{ operation['name'] }};
+{%- endif %}
+    lock.unlock();
+
+{{ operation | get_stream_fragment(driver) }}
+}
+
+{% endfor %}
+
 int Driver<driver_id_of<{{ driver.objects[0]["type"] }}>>::execute(Command& cmd)
 {
+{%- if driver.stream_operations %}
+    if (cmd.stream_frames > 0) {
+        switch (cmd.operation) {
+{% for operation in driver.stream_operations -%}
+          case {{ operation['tag'] }}: {
+            return stream_operation<{{ operation['tag'] }}>(cmd);
+          }
+{% endfor %}
+          default:
+            break;
+        }
+    }
+{% endif %}
     std::lock_guard<std::mutex> lock(mutex);
 
     switch(cmd.operation) {
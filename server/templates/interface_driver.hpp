@@ -24,6 +24,7 @@ class Driver<driver_id_of<{{ driver.objects[0]["type"] }}>> : public DriverAbstr
   public:
     int execute(Command& cmd);
     template<int op> int execute_operation(Command& cmd);
+    template<int op> int stream_operation(Command& cmd);
 
     Driver(Server *server_, {{ driver.objects[0]["type"] }}& {{ driver.objects[0]["name"] }}_)
     : DriverAbstract(driver_id_of<{{ driver.objects[0]["type"] }}>, server_)
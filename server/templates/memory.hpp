@@ -62,6 +62,12 @@ static_assert({{ offset }} < mem::status_range, "Invalid ps status register offs
 {% endfor %}
 
 constexpr uint32_t dna = 0;
+
+// -- Number of registers
+constexpr size_t n_control = {{ config['control_registers'] | length }};
+constexpr size_t n_ps_control = {{ config['ps_control_registers'] | length }};
+constexpr size_t n_status = {{ config['status_registers'] | length }};
+constexpr size_t n_ps_status = {{ config['ps_status_registers'] | length }};
 } // namespace reg
 
 namespace prm {
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Offline tests of the instruments API (os/api) with the Flask test client: pytest tests/test_api.py
+
+import os
+import io
+import sys
+import types
+import shutil
+import hashlib
+import zipfile
+import importlib.util
+import pytest
+
+API_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'os', 'api', '__init__.py')
+
+@pytest.fixture(scope='module')
+def api(tmp_path_factory):
+    ''' The API module, with its directories in a temporary directory '''
+    dirname = str(tmp_path_factory.mktemp('api'))
+    environ = {
+        'KOHERON_INSTRUMENTS_DIRNAME': os.path.join(dirname, 'instruments/'),
+        'KOHERON_LIVE_INSTRUMENT_DIRNAME': os.path.join(dirname, 'live-instrument/'),
+        'KOHERON_STAGING_DIRNAME': os.path.join(dirname, 'instruments-cache/')
+    }
+    os.makedirs(environ['KOHERON_INSTRUMENTS_DIRNAME'])
+    # Only available in the uWSGI server
+    sys.modules.setdefault('uwsgi', types.ModuleType('uwsgi'))
+
+    old_environ = os.environ.copy()
+    os.environ.update(environ)
+    try:
+        spec = importlib.util.spec_from_file_location('koheron_api', API_FILENAME)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.environ.clear()
+        os.environ.update(old_environ)
+    return module
+
+@pytest.fixture
+def app(api):
+    ''' App with an empty instruments directory '''
+    app = api.app
+    shutil.rmtree(app.instruments_dirname)
+    os.makedirs(app.instruments_dirname)
+    api.zip_index_cache.clear()
+    app.metrics = api.Metrics()
+    app.init_instruments(app.instruments_dirname)
+    app.live_instrument = {'name': 'live', 'version': '0.1.0', 'is_default': False}
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def make_zip(version):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as archive:
+        archive.writestr('version', version + '\n')
+        archive.writestr('data.bin', os.urandom(1000))
+    return data.getvalue()
+
+def upload_url(filename, data, offset=None):
+    url = '/api/instruments/uploads/{}?size={}&sha256={}'.format(filename, len(data), hashlib.sha256(data).hexdigest())
+    if offset is not None:
+        url += '&offset={}'.format(offset)
+    return url
+
+# Chunked uploads
+
+def test_upload(app, client):
+    data = make_zip('1.0.0')
+    response = client.post(upload_url('foo.zip', data))
+    assert response.get_json() == {'offset': 0, 'complete': False}
+
+    offset = 0
+    for i in range(0, len(data), 500):
+        response = client.put(upload_url('foo.zip', data, offset), data=data[i:i + 500])
+        assert response.status_code == 200
+        offset = response.get_json()['offset']
+    assert response.get_json() == {'offset': len(data), 'complete': True}
+
+    with open(os.path.join(app.instruments_dirname, 'foo.zip'), 'rb') as f:
+        assert f.read() == data
+    assert app.get_part_filenames() == []
+    assert app.instruments_list == [{'name': 'foo', 'version': '1.0.0', 'is_default': False}]
+
+    # Already stored
+    assert client.post(upload_url('foo.zip', data)).get_json() == {'offset': len(data), 'complete': True}
+
+def test_upload_resume(app, client):
+    data = make_zip('1.0.0')
+    client.post(upload_url('foo.zip', data))
+    client.put(upload_url('foo.zip', data, 0), data=data[:100])
+    assert client.post(upload_url('foo.zip', data)).get_json() == {'offset': 100, 'complete': False}
+
+    # Chunk not at the end of the part file: the client is given the expected offset
+    response = client.put(upload_url('foo.zip', data, 50), data=data[50:100])
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 100
+
+    response = client.put(upload_url('foo.zip', data, 100), data=data[100:])
+    assert response.get_json() == {'offset': len(data), 'complete': True}
+
+def test_upload_invalid(app, client):
+    data = make_zip('1.0.0')
+    assert client.post(upload_url('foo.txt', data)).status_code == 400
+    assert client.post('/api/instruments/uploads/foo.zip?size=10&sha256=xyz').status_code == 400
+
+    client.post(upload_url('foo.zip', data))
+    # Chunk beyond the archive size
+    assert client.put(upload_url('foo.zip', data, 0), data=data + b'x').status_code == 400
+
+    # SHA-256 mismatch: the part file is removed
+    url = upload_url('foo.zip', data, 0).replace(hashlib.sha256(data).hexdigest(), 'a' * 64)
+    client.post(url.replace('&offset=0', ''))
+    response = client.put(url, data=data)
+    assert response.status_code == 400
+    assert 'SHA-256' in response.get_json()['error']
+    assert not os.path.exists(os.path.join(app.instruments_dirname, 'foo.zip'))
+    assert app.get_part_filenames() == []
+
+def test_upload_stale_parts(app, client):
+    old_data = make_zip('1.0.0')
+    client.post(upload_url('foo.zip', old_data))
+    client.post(upload_url('foobar.zip', old_data))
+    expired = app.get_part_filename('bar.zip', 'b' * 64)
+    open(expired, 'wb').close()
+    os.utime(expired, (0, 0))
+
+    # Starting the upload of a new version removes the part of the old one and the expired parts
+    data = make_zip('1.1.0')
+    client.post(upload_url('foo.zip', data))
+    assert sorted(app.get_part_filenames()) == sorted([app.get_part_filename('foo.zip', hashlib.sha256(data).hexdigest()),
+                                                       app.get_part_filename('foobar.zip', hashlib.sha256(old_data).hexdigest())])
+
+    assert client.delete('/api/instruments/uploads/foo.zip').get_json() == {'removed': 1}
+    assert client.delete('/api/instruments/uploads/foo.zip').get_json() == {'removed': 0}
+    assert len(app.get_part_filenames()) == 1
+
+# Conditional requests
+
+def add_instrument(app, name, version):
+    with open(os.path.join(app.instruments_dirname, name + '.zip'), 'wb') as f:
+        f.write(make_zip(version))
+    app.refresh_instruments([name + '.zip'])
+
+def test_etag(app, client):
+    response = client.get('/api/instruments')
+    assert response.status_code == 200
+    assert response.get_json() == {'instruments': [], 'live_instrument': 'live'}
+    etag = response.headers['ETag']
+
+    response = client.get('/api/instruments', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == etag
+
+    # The query string is part of the ETag
+    assert client.get('/api/instruments?fields=name', headers={'If-None-Match': etag}).status_code == 200
+
+    add_instrument(app, 'foo', '1.0.0')
+    response = client.get('/api/instruments', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['instruments'] == ['foo']
+    assert response.headers['ETag'] != etag
+
+def test_if_modified_since(app, client):
+    last_modified = client.get('/api/instruments').headers['Last-Modified']
+    assert client.get('/api/instruments', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    # Modified in the same second
+    app.increment_generation()
+    assert client.get('/api/instruments', headers={'If-Modified-Since': last_modified}).status_code == 200
+
+def test_fields(app, client):
+    add_instrument(app, 'foo', '1.0.0')
+    response = client.get('/api/instruments/details?fields=name,version')
+    assert response.get_json() == {'instruments': [{'name': 'foo', 'version': '1.0.0'}],
+                                   'live_instrument': {'name': 'live', 'version': '0.1.0'}}
+
+    response = client.get('/api/instruments/details')
+    assert response.get_json()['instruments'] == [{'name': 'foo', 'version': '1.0.0', 'is_default': False}]
+
+# Metrics
+
+def test_metrics(app, client):
+    data = make_zip('1.0.0')
+    client.post(upload_url('foo.zip', data))
+    client.put(upload_url('foo.zip', data, 0), data=data)
+
+    metrics = client.get('/api/metrics').get_json()
+    assert metrics['upload_bytes'] == len(data)
+    assert metrics['counters']['upload'] == {'success': 1}
+    assert metrics['durations']['upload']['count'] == 1
+    assert metrics['durations']['upload']['buckets']['+Inf'] == 1
+    assert metrics['gauges']['instruments'] == 1
+    assert metrics['gauges']['instruments_bytes'] == len(data)
+    assert metrics['live_instrument'] == 'live'
+
+def test_metrics_prometheus(app, client):
+    app.metrics.observe('install', 0.2)
+    app.metrics.observe('install', 3, 'failure')
+    app.metrics.add_upload_bytes(1000)
+
+    response = client.get('/api/metrics?format=prometheus')
+    assert response.headers['Content-Type'] == 'text/plain; version=0.0.4'
+    lines = response.get_data(as_text=True).splitlines()
+
+    for line in [
+        '# TYPE koheron_api_operations_total counter',
+        'koheron_api_operations_total{operation="install",status="failure"} 1',
+        'koheron_api_operations_total{operation="install",status="success"} 1',
+        '# TYPE koheron_api_operation_duration_seconds histogram',
+        'koheron_api_operation_duration_seconds_bucket{operation="install",le="0.1"} 0',
+        'koheron_api_operation_duration_seconds_bucket{operation="install",le="0.25"} 1',
+        'koheron_api_operation_duration_seconds_bucket{operation="install",le="5"} 2',
+        'koheron_api_operation_duration_seconds_bucket{operation="install",le="+Inf"} 2',
+        'koheron_api_operation_duration_seconds_sum{operation="install"} 3.2',
+        'koheron_api_operation_duration_seconds_count{operation="install"} 2',
+        '# TYPE koheron_api_upload_bytes_total counter',
+        'koheron_api_upload_bytes_total 1000',
+        '# TYPE koheron_api_instruments gauge',
+        'koheron_api_instruments 0'
+    ]:
+        assert line in lines
+
+    # One sample or comment per line: '# TYPE name type' or 'name{labels} value'
+    for line in lines:
+        assert len(line.split()) == (4 if line.startswith('#') else 2)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Offline tests of the koheron command line interface: pytest tests/test_cli.py
+
+import os
+import sys
+
+sys.path = [os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python')] + sys.path
+from koheron import cli
+
+# Hosts
+
+def test_expand_hosts():
+    assert cli.expand_hosts(['host', '192.168.1.0/30', '192.168.1.1', '10.0.0.1/32']) == ['host', '192.168.1.1', '192.168.1.2', '10.0.0.1']
+
+def test_expand_hosts_file(tmpdir):
+    hosts_file = tmpdir.join('hosts.txt')
+    hosts_file.write('\n'.join(['# Lab', 'host1', '  host2  # Rack 2', '', '192.168.1.4/31', 'host1']))
+    with open(str(hosts_file)) as f:
+        assert cli.expand_hosts(['host0', 'host1'], f) == ['host0', 'host1', 'host2', '192.168.1.4', '192.168.1.5']
+
+def test_map_hosts():
+    def func(host):
+        if host == 'bad':
+            raise RuntimeError('Connection refused')
+        return host.upper()
+
+    results = cli.map_hosts(cli.ConnectionType(['a', 'bad', 'c'], jobs=2), func)
+    assert [result['host'] for result in results] == ['a', 'bad', 'c']
+    assert [result['status'] for result in results] == ['ok', 'error', 'ok']
+    assert [result['result'] for result in results] == ['A', 'Connection refused', 'C']
+
+# Command arguments
+
+def test_parse_arg():
+    assert cli.parse_arg('uint32_t', '0x10') == 16
+    assert cli.parse_arg('const int32_t&', '-3') == -3
+    assert cli.parse_arg('float', '1.5') == 1.5
+    assert cli.parse_arg('bool', 'true') is True
+    assert cli.parse_arg('bool', '0') is False
+    assert cli.parse_arg('const std::string&', '0x10') == '0x10'
+
+def test_parse_array_arg(tmpdir):
+    import numpy as np
+    array = cli.parse_arg('const std::array<uint32_t, 3>&', '1, 0x2,3,')
+    assert array.dtype == np.uint32
+    assert array.tolist() == [1, 2, 3]
+
+    filename = str(tmpdir.join('data.npy'))
+    np.save(filename, np.arange(6, dtype='float64').reshape(2, 3))
+    vector = cli.parse_arg('std::vector<float>', filename)
+    assert vector.dtype == np.float32
+    assert vector.tolist() == [0, 1, 2, 3, 4, 5]
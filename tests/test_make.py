@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Offline tests of make.py (no board needed): pytest tests/test_make.py
+
+import os
+import sys
+import io
+import pytest
+
+sys.path = [os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')] + sys.path
+import make
+import server
+
+@pytest.fixture(autouse=True)
+def sdk(tmpdir, monkeypatch):
+    ''' Empty SDK directory, fresh caches '''
+    monkeypatch.setattr(make, 'SDK_PATH', str(tmpdir))
+    monkeypatch.setattr(make, 'config_cache', {})
+    monkeypatch.setattr(make, 'config_cache_updated', False)
+    monkeypatch.setattr(make, 'modules_cache', {})
+    monkeypatch.setattr(server, 'updated_files', [])
+    return tmpdir
+
+def write_config(dirname, content):
+    filename = os.path.join(str(dirname), 'config.yml')
+    if not os.path.exists(str(dirname)):
+        os.makedirs(str(dirname))
+    with open(filename, 'w') as f:
+        f.write(content)
+    return filename
+
+def read(filename):
+    with io.open(filename, encoding='utf-8') as f:
+        return f.read()
+
+# --batch
+
+def test_batch(sdk):
+    config = write_config(sdk, 'name: foo\nversion: 1.2.3\n')
+    manifest = sdk.join('outputs.manifest')
+    manifest.write('\n'.join([
+        '# Comment',
+        '',
+        '--name {} {}'.format(config, sdk.join('out', 'name')),
+        '  --version {} {}  '.format(config, sdk.join('out', 'version'))
+    ]))
+    assert make.run_batch(str(manifest)) == 0
+    assert read(str(sdk.join('out', 'name'))) == 'foo'
+    assert read(str(sdk.join('out', 'version'))) == '1.2.3'
+    # Files read by all the commands
+    assert read(str(manifest) + '.d').startswith('{}: {}\n'.format(manifest, config))
+
+def test_batch_quoted_arguments(sdk):
+    config = write_config(sdk.join('with space'), 'name: foo\n')
+    manifest = sdk.join('outputs.manifest')
+    manifest.write("--name '{}' {}\n".format(config, sdk.join('name')))
+    assert make.run_batch(str(manifest)) == 0
+    assert read(str(sdk.join('name'))) == 'foo'
+
+def test_batch_failure(sdk):
+    ''' A failing command is counted and does not stop the next ones '''
+    config = write_config(sdk, 'name: foo\n')
+    manifest = sdk.join('outputs.manifest')
+    manifest.write('\n'.join([
+        '--unknown {} {}'.format(config, sdk.join('unknown')),
+        '--version {} {}'.format(sdk.join('missing.yml'), sdk.join('version')),
+        '--name {} {}'.format(config, sdk.join('name'))
+    ]))
+    assert make.run_batch(str(manifest)) == 2
+    assert read(str(sdk.join('name'))) == 'foo'
+
+def test_batch_stdin(sdk, monkeypatch):
+    config = write_config(sdk, 'name: foo\n')
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(u'--name {} {}\n'.format(config, sdk.join('name'))))
+    assert make.run_batch('-') == 0
+    assert read(str(sdk.join('name'))) == 'foo'
+    assert not os.path.exists('-.d')
+
+def test_batch_loads_config_once(sdk, monkeypatch):
+    config = write_config(sdk, 'name: foo\nversion: 1.2.3\n')
+    n_loads = []
+    yaml_load = make.yaml.load
+    monkeypatch.setattr(make.yaml, 'load', lambda *args, **kwargs: n_loads.append(1) or yaml_load(*args, **kwargs))
+    manifest = sdk.join('outputs.manifest')
+    manifest.write('--name {0} {1}\n--version {0} {2}\n'.format(config, sdk.join('name'), sdk.join('version')))
+    assert make.run_batch(str(manifest)) == 0
+    assert len(n_loads) == 1
+
+# write_if_changed
+
+def test_write_if_changed(sdk):
+    filename = str(sdk.join('out', 'file'))
+    os.makedirs(os.path.dirname(filename))
+    assert server.write_if_changed(filename, u'foo')
+    assert read(filename) == 'foo'
+    assert server.updated_files == [filename]
+
+    os.utime(filename, (0, 0))
+    assert not server.write_if_changed(filename, u'foo')
+    assert os.path.getmtime(filename) == 0
+    assert server.updated_files == [filename]
+
+    # Same size, different content
+    assert server.write_if_changed(filename, u'bar')
+    assert read(filename) == 'bar'
+    assert os.path.getmtime(filename) != 0
+    # No temporary file left
+    assert os.listdir(os.path.dirname(filename)) == ['file']
+
+def test_write_if_changed_no_report(sdk):
+    filename = str(sdk.join('file'))
+    assert server.write_if_changed(filename, u'é', report=False)
+    assert read(filename) == u'é'
+    assert server.updated_files == []
+
+# Dependency files
+
+def test_write_dependencies(sdk):
+    output = str(sdk.join('output'))
+    make.write_dependencies(output, ['a.yml', 'b.hpp', 'a.yml'])
+    assert read(output + '.d') == '{}: a.yml \\\n  b.hpp\n\na.yml:\nb.hpp:\n'.format(output)
+    # The .d files are not reported as updated
+    assert server.updated_files == []
+
+def test_dependencies_of_command(sdk):
+    config = write_config(sdk, 'name: foo\n')
+    output = str(sdk.join('name'))
+    assert make.run(['--name', config, output]) == [config]
+    assert read(output + '.d') == '{0}: {1}\n\n{1}:\n'.format(output, config)
+
+# Modules
+
+def test_resolve_modules(sdk):
+    write_config(sdk.join('modules', 'a'), 'cores:\n  - cores/a\n  - cores/common\ndrivers:\n  - ./a.hpp\nmodules:\n  - modules/c/config.yml\n')
+    write_config(sdk.join('modules', 'b'), 'cores:\n  - cores/common\n  - cores/b\nmodules:\n  - modules/c/config.yml\n')
+    write_config(sdk.join('modules', 'c'), 'cores:\n  - cores/c\nxdc:\n  - ./c.xdc\n')
+    config = write_config(sdk.join('instrument'), '\n'.join([
+        'cores:',
+        '  - ./cores/instrument',
+        'drivers:',
+        '  - ./instrument.hpp',
+        'xdc:',
+        '  - boards/board.xdc',
+        'modules:',
+        '  - modules/a/config.yml',
+        '  - modules/b/config.yml'
+    ]))
+    modules = {field: [os.path.normpath(path) for path in paths] for field, paths in make.resolve_modules(config).items()}
+
+    assert modules['cores'] == [str(sdk.join('instrument', 'cores', 'instrument'))] + [str(sdk.join('cores', x)) for x in ['a', 'common', 'c', 'b']]
+    # Only the drivers and xdc files of the config itself
+    assert modules['drivers'] == [str(sdk.join('instrument', 'instrument.hpp'))]
+    assert modules['xdc'] == [str(sdk.join('boards', 'board.xdc'))]
+    assert modules['configs'] == [config] + [str(sdk.join('modules', x, 'config.yml')) for x in ['a', 'c', 'b']]
+
+def test_resolve_modules_cached(sdk, monkeypatch):
+    write_config(sdk.join('modules', 'a'), 'cores:\n  - cores/a\n')
+    config = write_config(sdk, 'modules:\n  - modules/a/config.yml\n  - modules/a/config.yml\n')
+    n_loads = []
+    load_config = make.load_config
+    monkeypatch.setattr(make, 'load_config', lambda filename: n_loads.append(filename) or load_config(filename))
+    assert make.resolve_modules(config) is make.resolve_modules(config)
+    assert make.resolve_modules(config)['cores'] == [str(sdk.join('cores', 'a'))]
+    assert len(n_loads) == 2
+
+def test_resolve_modules_circular(sdk):
+    write_config(sdk.join('modules', 'a'), 'modules:\n  - modules/b/config.yml\n')
+    write_config(sdk.join('modules', 'b'), 'modules:\n  - modules/a/config.yml\n')
+    config = write_config(sdk, 'modules:\n  - modules/a/config.yml\n')
+    with pytest.raises(ValueError, match='Circular'):
+        make.resolve_modules(config)
+
+# Memory map
+
+def memory(name, range_, offset=None, n_blocks=1):
+    address = {'name': name, 'range': range_, 'n_blocks': n_blocks}
+    if offset is not None:
+        address['offset'] = offset
+    return address
+
+def test_memory_map():
+    memories = [memory('adc', '8K'), memory('control', '4K', '0x40000000'), memory('dac', '4K', n_blocks=2), memory('status', '4K', '0x50000000')]
+    memory_map = make.build_memory_map(memories)
+    assert memory_map == [
+        ('control', 0x40000000, 4096, 1),
+        ('adc', 0x40002000, 8192, 1),
+        ('dac', 0x40004000, 4096, 2),
+        ('status', 0x50000000, 4096, 1)
+    ]
+    # Assigned offsets are written in the config
+    assert memories[0]['offset'] == '0x40002000'
+
+@pytest.mark.parametrize('memories, message', [
+    ([memory('a', '4K', '0x40000000'), memory('b', '8K', '0x40000000')], 'overlaps'),
+    ([memory('a', '4K', '0x40000000', n_blocks=2), memory('b', '4K', '0x40001000')], 'overlaps'),
+    ([memory('a', '8K', '0x40001000')], 'not aligned'),
+    ([memory('a', '12K')], 'power of two'),
+    ([memory('a', '2K')], 'power of two'),
+    ([memory('a', '1G', '0xC0000000', n_blocks=2)], '32-bit')
+])
+def test_invalid_memory_map(memories, message):
+    with pytest.raises(ValueError, match=message):
+        make.build_memory_map(memories)
+
+def test_register_map():
+    memory_map = make.build_memory_map([memory('control', '4K'), memory('status', '4K')])
+    config = {'control_registers': ['led', 'dac0', 'dac1'], 'ps_control_registers': ['spi'], 'status_registers': [str(i) for i in range(1025)]}
+    with pytest.raises(ValueError, match='do not fit'):
+        make.build_register_map(config, memory_map)
+    config['status_registers'] = ['adc']
+    assert make.build_register_map(config, memory_map) == {
+        'control': [('led', 0), ('dac0', 4), ('dac1', 8)],
+        'status': [('adc', 0)]
+    }
+
+# Config cache
+
+@pytest.fixture
+def yaml_loads(monkeypatch):
+    ''' Configs parsed by yaml.load '''
+    loads = []
+    yaml_load = make.yaml.load
+    monkeypatch.setattr(make.yaml, 'load', lambda *args, **kwargs: loads.append(1) or yaml_load(*args, **kwargs))
+    return loads
+
+def test_config_cache(sdk, yaml_loads):
+    config = write_config(sdk, 'name: foo\n')
+    assert make.load_config(config) == {'name': 'foo'}
+    # Returns a copy
+    make.load_config(config)['name'] = 'bar'
+    assert make.load_config(config) == {'name': 'foo'}
+    assert len(yaml_loads) == 1
+
+    # Touched but unchanged
+    os.utime(config, (0, 0))
+    assert make.load_config(config) == {'name': 'foo'}
+    assert len(yaml_loads) == 1
+    assert make.config_cache[os.path.abspath(config)][0] == 0
+
+    # Same size, new content
+    write_config(sdk, 'name: bar\n')
+    os.utime(config, (1, 1))
+    assert make.load_config(config) == {'name': 'bar'}
+    assert len(yaml_loads) == 2
+
+def test_config_cache_file(sdk, yaml_loads):
+    config = write_config(sdk, 'name: foo\n')
+    cache_filename = str(sdk.join('tmp', 'config_cache.pickle'))
+    make.save_config_cache(cache_filename)
+    assert not os.path.exists(cache_filename)
+
+    make.load_config(config)
+    make.save_config_cache(cache_filename)
+    make.config_cache = {}
+    make.load_config_cache(cache_filename)
+    assert make.load_config(config) == {'name': 'foo'}
+    assert len(yaml_loads) == 1
+
+def test_invalid_config_cache(sdk):
+    cache_filename = sdk.join('config_cache.pickle')
+    cache_filename.write('invalid')
+    make.load_config_cache(str(cache_filename))
+    assert make.config_cache == {}
@@ -98,11 +98,17 @@ class Tests
         return std::make_tuple(501762438, 507.3858, 926547.6468507200, true);
     }
 
+    /// @stream
+    uint32_t get_next_count() {
+        return count++;
+    }
+
   private:
     std::vector<float> vector;
     std::vector<uint32_t> vector_u;
     std::array<uint32_t, 8192> array;
     std::string string;
+    uint32_t count = 0;
 
     std::string const_string = "Hello World const";
 };
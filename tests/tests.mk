@@ -6,6 +6,11 @@ PHONY: tests_py
 tests_py: run
 	HOST=$(HOST) pytest -v $(TESTS_PATH)/tests.py
 
+# Tests that do not need a board
+PHONY: tests_offline
+tests_offline:
+	pytest -v $(TESTS_PATH)/test_*.py
+
 # TODO fix ugly hack
 $(TMP)/koheron_with_exports.ts: $(WEB_PATH)/koheron.ts
 	rm -f $@
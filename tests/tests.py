@@ -129,4 +129,40 @@ def test_get_tuple():
     assert tup[0] == 501762438
     assert abs(tup[1] - 507.3858) < 5E-6
     assert abs(tup[2] - 926547.6468507200) < 1E-14
-    assert tup[3]
\ No newline at end of file
+    assert tup[3]
+
+def test_stream():
+    first = list(client.stream('Tests', 'get_next_count', count=1))[0] + 1
+    counts = list(client.stream('Tests', 'get_next_count', count=100, batch=16))
+    assert counts == list(range(first, first + 100))
+
+def test_batch():
+    batch = client.batch()
+    batch.add('Tests', 'set_scalars', 429496729, -2048, np.pi, True, np.exp(1), 42)
+    batch.add('Tests', 'get_const_vector')
+    batch.add('Tests', 'set_string', 'Hello World')
+    batch.add('Tests', 'get_tuple')
+    for _ in range(2):
+        ok, vec, ok_str, tup = batch.execute()
+        assert ok and ok_str
+        assert np.array_equal(vec, np.arange(42, dtype='uint32')**2)
+        assert tup[0] == 501762438
+
+def test_batch_failure():
+    batch = client.batch()
+    batch.add('Tests', 'get_tuple')
+    batch.add('KServer', 'get_version') # Server commands cannot be batched
+    batch.add('Tests', 'set_string', 'Hello World')
+    batch.add('Tests', 'get_tuple')
+    with pytest.raises(RuntimeError):
+        batch.execute()
+    # The commands not executed must not be left on the socket
+    assert tests.get_server_version() == client.call('KServer', 'get_version')
+    assert tests.get_tuple()[0] == 501762438
+
+def test_sizes():
+    assert client.get_sizes('Tests', 'set_scalars') == (23, 1)
+    assert client.get_sizes('Tests', 'get_array') == (0, 4 * 8192)
+    assert client.get_sizes('Tests', 'get_tuple') == (0, 21)
+    assert client.get_sizes('Tests', 'get_vector') == (0, None)
+    assert client.get_sizes('Tests', 'set_string') == (None, 1)
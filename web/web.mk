@@ -7,7 +7,7 @@ include $(WEB_DOWNLOADS_MK)
 TSC_BIN := node_modules/typescript/bin/tsc
 TSC ?= $(TSC_BIN) --pretty --target ES5 --lib es6,dom --alwaysStrict
 
-WEB_FILES := $(shell $(MAKE_PY) --web $(CONFIG) $(TMP_WEB_PATH)/web_files && cat $(TMP_WEB_PATH)/web_files)
+WEB_FILES := $(shell cat $(TMP_WEB_PATH)/web_files 2> /dev/null)
 
 TS_FILES := $(filter %.ts,$(WEB_FILES))
 NO_TS_FILES := $(filter-out $(TS_FILES),$(WEB_FILES))